@@ -0,0 +1,121 @@
+# agents/_gemini.py — Shared Gemini helpers for the agent layer
+
+import hashlib
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+
+from config.settings import ENABLE_CONTEXT_CACHE, CONTEXT_CACHE_TTL_SECONDS
+
+if TYPE_CHECKING:
+    from google import genai
+
+logger = logging.getLogger(__name__)
+
+# key → (cache name or None, monotonic expiry)
+_CONTEXT_CACHES: Dict[str, Tuple[Optional[str], float]] = {}
+_CONTEXT_CACHE_LOCK = threading.Lock()
+
+# Refresh a little before the server-side TTL so requests never race expiry
+_REFRESH_MARGIN_SECONDS = 60
+
+
+# ============================================================
+# Unified Gemini text extractor
+# ============================================================
+def extract_text_from_gemini(resp) -> Optional[str]:
+    """Extracts text from all possible Gemini response shapes."""
+    if hasattr(resp, "text") and resp.text:
+        return resp.text.strip()
+
+    try:
+        parts = resp.candidates[0].content.parts
+        texts = [p.text for p in parts if getattr(p, "text", None)]
+        return "\n".join(texts).strip() or None
+    except Exception:
+        return None
+
+
+# ============================================================
+# Explicit context caching
+# ============================================================
+def get_cached_content(
+    client: "genai.Client",
+    model: str,
+    system_instruction: str,
+    ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS,
+) -> Optional[str]:
+    """
+    Returns the name of a Gemini context cache holding `system_instruction`
+    for `model`, creating it lazily and re-creating it once the TTL lapses.
+
+    None means "send the instruction inline": caching is disabled, or the
+    cache could not be created (e.g. prefix below the model's minimum size).
+    Failures are remembered for one TTL so we do not retry on every request.
+    """
+    if not ENABLE_CONTEXT_CACHE:
+        return None
+
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    key = f"{model}:{digest}"
+    now = time.monotonic()
+
+    with _CONTEXT_CACHE_LOCK:
+        entry = _CONTEXT_CACHES.get(key)
+        if entry and entry[1] > now:
+            return entry[0]
+
+        try:
+            from google.genai import types
+
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    ttl=f"{ttl_seconds}s",
+                ),
+            )
+            name = cache.name
+            expires = now + max(ttl_seconds - _REFRESH_MARGIN_SECONDS, 1)
+            logger.info("[Gemini] Context cache ready: %s", name)
+        except Exception as e:
+            logger.warning("[Gemini] Context cache unavailable, sending inline: %s", e)
+            name = None
+            expires = now + ttl_seconds
+
+        _CONTEXT_CACHES[key] = (name, expires)
+        return name
+
+
+# ============================================================
+# Retry with exponential backoff
+# ============================================================
+def is_transient_error(exc: BaseException) -> bool:
+    """Rate limits, 5xx and transport errors are worth retrying; other 4xx are not."""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code == 429 or code >= 500
+    return True
+
+
+def gemini_retrying(
+    attempts: int = 3,
+    retry_when: Callable[[BaseException], bool] = is_transient_error,
+) -> Retrying:
+    """
+    tenacity policy for Gemini calls: `gemini_retrying()(fn, *args, **kwargs)`.
+    The last error is re-raised so callers keep their own failure handling.
+    """
+    return Retrying(
+        stop=stop_after_attempt(attempts),
+        wait=wait_exponential(multiplier=1, max=10),
+        retry=retry_if_exception(retry_when),
+        before_sleep=lambda rs: logger.warning(
+            "[Gemini] Attempt %d failed (%s) — retrying.",
+            rs.attempt_number, rs.outcome.exception(),
+        ),
+        reraise=True,
+    )
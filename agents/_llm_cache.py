@@ -0,0 +1,76 @@
+# agents/_llm_cache.py — Content-addressed disk cache for LLM responses
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from config.settings import ENABLE_LLM_CACHE, LLM_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# Keys
+# ============================================================
+def make_key(*parts: Any) -> str:
+    """SHA-256 over everything that determines the response (model, instruction, prompt, config)."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _path(namespace: str, key: str) -> Path:
+    return Path(LLM_CACHE_DIR) / namespace / f"{key}.txt"
+
+
+# ============================================================
+# Read / write
+# ============================================================
+def get(namespace: str, key: str, ttl_seconds: Optional[float] = None) -> Optional[str]:
+    """Cached response text, or None on miss / expiry / when caching is off."""
+    if not ENABLE_LLM_CACHE:
+        return None
+
+    path = _path(namespace, key)
+    try:
+        if ttl_seconds is not None and time.time() - path.stat().st_mtime > ttl_seconds:
+            return None
+        return path.read_bytes().decode("utf-8")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("[LLMCache] Unreadable entry %s: %s", path, e)
+        return None
+
+
+def put(namespace: str, key: str, text: str) -> None:
+    """Store `text` atomically (temp file + os.replace) so readers never see a partial entry."""
+    if not ENABLE_LLM_CACHE or not text:
+        return
+
+    path = _path(namespace, key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(text.encode("utf-8"))
+        os.replace(tmp, path)
+    except Exception as e:
+        logger.warning("[LLMCache] Could not store %s: %s", path, e)
+
+
+def cached_generate(namespace: str, key: str, generate: Callable[[], Optional[str]]) -> Optional[str]:
+    """Return the cached text for `key`, or call `generate()` and cache a non-empty result."""
+    hit = get(namespace, key)
+    if hit is not None:
+        logger.info("[LLMCache] %s hit (%s…)", namespace, key[:12])
+        return hit
+
+    text = generate()
+    if text:
+        put(namespace, key, text)
+    return text
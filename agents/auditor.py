@@ -1,22 +1,39 @@
 # agents/auditor.py — Clean, Production-Ready Auditor Agent
-from google import genai
-from google.genai import types
-from pydantic import BaseModel, Field
-from tools.document_reader import extract_text_from_document
-from typing import List, Optional, Dict, Any, ClassVar
+from pydantic import BaseModel, Field, TypeAdapter
+from tools.document_reader import extract_text_from_document_cached
+from tools.io_utils import json_loads, save_llm_raw_dump
+from tools.relevance import bm25_top_k, split_passages
+from ._gemini import get_cached_content
+from config.settings import AUDITOR_VERIFY, AUDITOR_VERIFY_THRESHOLD
+from typing import TYPE_CHECKING, List, Optional, Dict, Any, ClassVar, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
 import re
-import json
 import logging
+import threading
 
-logger = logging.getLogger("AuditorAgent")
-logger.setLevel(logging.INFO)
+if TYPE_CHECKING:
+    # google.genai is heavy (protobuf, auth) → only imported where a request is made
+    from google import genai
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+AUDITOR_MODEL = "gemini-2.5-flash"
+DEBUG_OUTPUT_DIR = "data/output"
+AUDITOR_VERIFY_MODEL = "gemini-2.5-pro"
+
+# How often the pro verifier fires — used to tune AUDITOR_VERIFY_THRESHOLD
+_VERIFY_STATS = {"runs": 0, "verified": 0}
+_VERIFY_STATS_LOCK = threading.Lock()
 
 
 # ============================================================
 # STRUCTURED DENIAL MODEL
 # ============================================================
-class StructuredDenial(BaseModel):
-    """Auditor Agent → unified structured memory object."""
+class _LLMDenial(BaseModel):
+    """Fields Gemini extracts → the response_schema contract."""
     _SCHEMA: ClassVar[dict] = {}
 
     denial_code: str
@@ -24,92 +41,229 @@ class StructuredDenial(BaseModel):
     policy_clause_text: str
     procedure_denied: str
     confidence_score: float
+
+
+class StructuredDenial(_LLMDenial):
+    """Auditor Agent → unified structured memory object."""
+    # filled locally from the document reader, never by the LLM
     raw_evidence_chunks: List[str] = Field(default_factory=list)
 
 
 # cache schema
-if not StructuredDenial._SCHEMA:
-    StructuredDenial._SCHEMA = StructuredDenial.model_json_schema()
+if not _LLMDenial._SCHEMA:
+    _LLMDenial._SCHEMA = _LLMDenial.model_json_schema()
+
+# Prebuilt validator for the per-response parse
+_LLM_ADAPTER = TypeAdapter(_LLMDenial)
+
+# Request-invariant prompt, built once at import.
+# The schema itself is enforced through response_schema, not repeated here.
+_SYSTEM_INSTRUCTION = (
+    "You are the Auditor Agent.\n"
+    "Extract only facts from the insurer's denial letter and policy.\n"
+    "Output STRICT JSON ONLY. Never use markdown, never explain.\n\n"
+    "Rules:\n"
+    "- If a field is missing in source text, set empty string or 0.0.\n"
+    "- Do NOT hallucinate.\n"
+)
+
+
+@lru_cache(maxsize=4)
+def _generate_config(cache_name: Optional[str]) -> "types.GenerateContentConfig":
+    """Auditor config only varies with the context-cache name → build once per name."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        system_instruction=None if cache_name else _SYSTEM_INSTRUCTION,
+        cached_content=cache_name,
+        response_mime_type="application/json",
+        response_schema=_LLMDenial._SCHEMA,
+        temperature=0.0,
+        max_output_tokens=2048
+    )
 
 
 # ============================================================
 # HELPERS
 # ============================================================
+_POLICY_KEYWORDS = (
+    "EXCLUSIONS", "EXCLUSIONS AND LIMITATIONS", "EXPERIMENTAL",
+    "INVESTIGATIVE", "UNPROVEN", "CLINICAL TRIAL", "NOT COVERED"
+)
+_SNIPPET_WINDOW = 1500
+_PARA_SPLIT_RE = re.compile(r"\n{2,}")
+_EXCL_CHECK_RE = re.compile(
+    "|".join(re.escape(kw) for kw in _POLICY_KEYWORDS), re.IGNORECASE
+)
+
+
 def find_relevant_policy_snippet(full_policy_text: str) -> str:
     """Heuristic extraction of the exclusion/experimental sections."""
-    keys = [
-        "EXCLUSIONS", "EXCLUSIONS AND LIMITATIONS", "EXPERIMENTAL",
-        "INVESTIGATIVE", "UNPROVEN", "CLINICAL TRIAL", "NOT COVERED"
-    ]
-    for kw in keys:
-        m = re.search(rf".{{0,1500}}{re.escape(kw)}.{{0,1500}}",
-                      full_policy_text,
-                      re.IGNORECASE | re.DOTALL)
-        if m:
-            blk = m.group(0)
-            paras = re.split(r"\n{2,}", blk)
-            for p in paras:
-                if any(k in p.upper() for k in keys):
-                    return p.strip()
-            return blk.strip()
+    # One pass over the policy: first hit of any keyword wins
+    m = _EXCL_CHECK_RE.search(full_policy_text)
+    if m:
+        blk = full_policy_text[max(0, m.start() - _SNIPPET_WINDOW):m.end() + _SNIPPET_WINDOW]
+        paras = _PARA_SPLIT_RE.split(blk)
+        for p in paras:
+            if _EXCL_CHECK_RE.search(p):
+                return p.strip()
+        return blk.strip()
 
     # fallback: first 4000 chars
     snippet = full_policy_text[:4000]
     return snippet.rsplit("\n", 1)[0].strip()
 
 
+POLICY_EXCERPT_PASSAGES = 3
+
+
+def select_policy_excerpt(denial_text: str, policy_text: str) -> str:
+    """
+    Keep only the policy passages that share the most vocabulary with the
+    denial letter (BM25); fall back to the keyword heuristic when nothing
+    overlaps.
+    """
+    # drop page markers / stray headings (same 40-char floor as document segments)
+    passages = [p for p in split_passages(policy_text) if len(p) > 40]
+    top = bm25_top_k(denial_text, passages, k=POLICY_EXCERPT_PASSAGES)
+    if top:
+        # document order reads more naturally than score order
+        return "\n\n".join(passages[i] for i in sorted(top))
+    return find_relevant_policy_snippet(policy_text)
+
+
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+
+
+def _loads_lenient(block: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json_loads(block)
+    except Exception:
+        # attempt trailing comma cleanup
+        try:
+            return json_loads(_TRAILING_COMMA_RE.sub(r"\1", block))
+        except Exception:
+            return None
+
+
 def extract_first_json(text: str) -> Optional[Dict[str, Any]]:
     """Balanced brace extraction for JSON recovery."""
     if not text:
         return None
+
+    # Fast path: the whole response is already a JSON object
+    try:
+        obj = json_loads(text)
+        if isinstance(obj, dict):
+            return obj
+    except Exception:
+        pass
+
     start = text.find("{")
     if start == -1:
         return None
 
+    # Jump between brace positions with str.find instead of visiting every char
     depth = 0
-    for i in range(start, len(text)):
-        if text[i] == "{":
+    next_open = start
+    next_close = text.find("}", start)
+    while next_close != -1:
+        if next_open != -1 and next_open < next_close:
             depth += 1
-        elif text[i] == "}":
+            next_open = text.find("{", next_open + 1)
+        else:
             depth -= 1
             if depth == 0:
-                block = text[start:i + 1]
-                try:
-                    return json.loads(block)
-                except Exception:
-                    # attempt trailing comma cleanup
-                    cleaned = re.sub(r",\s*([}\]])", r"\1", block)
-                    try:
-                        return json.loads(cleaned)
-                    except Exception:
-                        return None
+                return _loads_lenient(text[start:next_close + 1])
+            next_close = text.find("}", next_close + 1)
     return None
 
 
-def extract_text_from_gemini(resp) -> Optional[str]:
-    """Unified text extractor for all Gemini response shapes."""
-    if hasattr(resp, "text") and resp.text:
-        return resp.text.strip()
-
+# ============================================================
+# MODEL CALL
+# ============================================================
+def _extract_denial(
+    client: "genai.Client",
+    model: str,
+    context: List["types.Part"],
+) -> Optional[_LLMDenial]:
+    """One streamed Gemini extraction pass + tolerant parsing. None on any failure."""
+    logger.info("[Auditor] Sending prompt to %s...", model)
+
+    # Static instruction lives in a context cache when enabled;
+    # only the per-case documents are sent as the dynamic suffix.
+    cache_name = get_cached_content(client, model, _SYSTEM_INSTRUCTION)
+
+    parts: List[str] = []
+    resp = None
     try:
-        parts = resp.candidates[0].content.parts
-        text_blocks = [getattr(p, "text", "") for p in parts if getattr(p, "text", "")]
-        return "\n".join(text_blocks).strip() or None
-    except:
+        for resp in client.models.generate_content_stream(
+            model=model,
+            contents=context,
+            config=_generate_config(cache_name)
+        ):
+            text = getattr(resp, "text", None)
+            if not text:
+                continue
+            parts.append(text)
+    except Exception as e:
+        logger.error("[Auditor] Gemini API error: %s", e)
         return None
 
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is not None:
+        logger.debug("[Auditor] Prompt tokens: %s", getattr(usage, "prompt_token_count", None))
+
+    raw = "".join(parts).strip()
+    if not raw:
+        logger.error("[Auditor] Empty response (safety or API block).")
+        return None
+
+    # Primary parse
+    try:
+        return _LLM_ADAPTER.validate_json(raw)
+    except Exception:
+        logger.warning("[Auditor] Strict JSON parse failed, attempting recovery.")
+        recovered = extract_first_json(raw)
+        if not recovered:
+            logger.error("[Auditor] Could not recover JSON.")
+            _dump_debug("auditor_raw_response.txt", raw)
+            return None
+        try:
+            return _LLM_ADAPTER.validate_python(recovered)
+        except Exception as e:
+            logger.error("[Auditor] Recovery JSON invalid: %s", e)
+            _dump_debug("auditor_raw_response.txt", raw)
+            return None
+
+
+def _dump_debug(name: str, payload: str) -> None:
+    """Keep the unparseable response for inspection — DEBUG runs only."""
+    if logger.isEnabledFor(logging.DEBUG):
+        save_llm_raw_dump(payload, os.path.join(DEBUG_OUTPUT_DIR, name))
+
+
+def _needs_verification(sd: Optional[_LLMDenial]) -> bool:
+    if sd is None or sd.confidence_score < AUDITOR_VERIFY_THRESHOLD:
+        return True
+    return not (sd.denial_code and sd.procedure_denied and sd.insurer_reason_snippet)
+
 
 # ============================================================
 # AUDITOR AGENT
 # ============================================================
-def run_auditor_agent(client: genai.Client,
+def run_auditor_agent(client: "genai.Client",
                       denial_path: str,
                       policy_path: str) -> Optional[StructuredDenial]:
 
     logger.info("[Auditor] Extracting text...")
 
-    denial_res = extract_text_from_document(denial_path)
-    policy_res = extract_text_from_document(policy_path)
+    # Both PDFs are parsed independently → read them concurrently
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        denial_job = pool.submit(extract_text_from_document_cached, denial_path)
+        policy_job = pool.submit(extract_text_from_document_cached, policy_path)
+        denial_res = denial_job.result()
+        policy_res = policy_job.result()
 
     if denial_res.get("error") or policy_res.get("error"):
         logger.error("Document reader failed: %s",
@@ -117,88 +271,93 @@ def run_auditor_agent(client: genai.Client,
         return None
 
     denial_text = denial_res.get("full_text_content", "").strip()
-    policy_text = policy_res.get("full_text_content", "").strip()
+    # The policy can be very large and only an excerpt reaches the prompt,
+    # so check for content without copying it through .strip().
+    policy_text = policy_res.get("full_text_content", "")
 
-    if not denial_text or not policy_text:
+    if not denial_text or not policy_text or policy_text.isspace():
         logger.error("One or both input docs empty.")
         return None
 
-    # Evidence chunks (Judge consumes these)
-    segments = [
+    # Evidence chunks (Judge consumes these) — each segment stripped once
+    stripped = (
         seg.strip() for seg in (denial_res.get("segments", []) +
                                 policy_res.get("segments", []))
-        if seg and len(seg.strip()) > 30
-    ]
+        if seg
+    )
+    segments = [seg for seg in stripped if len(seg) > 30]
     evidence_chunks = segments[:24]
-    logger.info(f"[Auditor] Evidence chunks: {len(evidence_chunks)}")
+    logger.info("[Auditor] Evidence chunks: %d", len(evidence_chunks))
 
     # Identify key excerpt in policy
-    policy_excerpt = find_relevant_policy_snippet(policy_text)
-
-    # Build LLM context
-    context = (
-        "--- DENIAL LETTER ---\n"
-        f"{denial_text}\n\n"
-        "--- RELEVANT POLICY EXCERPT ---\n"
-        f"{policy_excerpt}"
-    )
+    policy_excerpt = select_policy_excerpt(denial_text, policy_text)
 
-    # System instruction
-    sys_instr = (
-        "You are the Auditor Agent.\n"
-        "Extract only facts from the insurer's denial letter and policy.\n"
-        "Output STRICT JSON ONLY.\n"
-        "Never use markdown, never explain. Follow this Pydantic schema:\n"
-        f"{json.dumps(StructuredDenial._SCHEMA, indent=2)}\n\n"
-        "Rules:\n"
-        "- If a field is missing in source text, set empty string or 0.0.\n"
-        "- Do NOT hallucinate.\n"
-        "- 'raw_evidence_chunks' MUST be an empty list.\n"
-    )
+    from google.genai import types
 
-    logger.info("[Auditor] Sending prompt to Gemini...")
+    # Build LLM context as separate parts → no concatenated copy of the documents
+    context = [
+        types.Part.from_text(text="--- DENIAL LETTER ---"),
+        types.Part.from_text(text=denial_text),
+        types.Part.from_text(text="--- RELEVANT POLICY EXCERPT ---"),
+        types.Part.from_text(text=policy_excerpt),
+    ]
 
-    try:
-        resp = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[context],
-            config=types.GenerateContentConfig(
-                system_instruction=sys_instr,
-                response_mime_type="application/json",
-                response_schema=StructuredDenial._SCHEMA,
-                temperature=0.0,
-                max_output_tokens=2048
+    sd = _extract_denial(client, AUDITOR_MODEL, context)
+
+    # Two-tier extraction: flash answers, pro only re-checks weak results
+    if AUDITOR_VERIFY:
+        verify = _needs_verification(sd)
+        # run_auditor_batch calls this from several threads
+        with _VERIFY_STATS_LOCK:
+            _VERIFY_STATS["runs"] += 1
+            if verify:
+                _VERIFY_STATS["verified"] += 1
+            verified, runs = _VERIFY_STATS["verified"], _VERIFY_STATS["runs"]
+        if verify:
+            logger.info(
+                "[Auditor] Low-confidence extraction → verifying with %s (%d/%d runs verified).",
+                AUDITOR_VERIFY_MODEL, verified, runs,
             )
-        )
-    except Exception as e:
-        logger.error(f"[Auditor] Gemini API error: {e}")
-        return None
+            checked = _extract_denial(client, AUDITOR_VERIFY_MODEL, context)
+            if checked and (sd is None or checked.confidence_score > sd.confidence_score):
+                sd = checked
 
-    raw = extract_text_from_gemini(resp)
-    if not raw:
-        logger.error("[Auditor] Empty response (safety or API block).")
+    if sd is None:
         return None
 
-    # Primary parse
-    try:
-        sd = StructuredDenial.model_validate_json(raw)
-    except Exception:
-        logger.warning("[Auditor] Strict JSON parse failed, attempting recovery.")
-        recovered = extract_first_json(raw)
-        if not recovered:
-            logger.error("[Auditor] Could not recover JSON.")
-            return None
-        try:
-            sd = StructuredDenial.model_validate(recovered)
-        except Exception as e:
-            logger.error(f"[Auditor] Recovery JSON invalid: {e}")
-            return None
-
-    # overwrite with evidence chunks from local extraction
-    sd.raw_evidence_chunks = evidence_chunks
+    # attach evidence chunks from local extraction
+    sd = StructuredDenial(**sd.model_dump(), raw_evidence_chunks=evidence_chunks)
 
     logger.info("[Auditor] SUCCESS — Structured denial created.")
-    logger.info(f"[Auditor] Denial Code → {sd.denial_code}")
-    logger.info(f"[Auditor] Procedure → {sd.procedure_denied}")
+    logger.info("[Auditor] Denial Code → %s", sd.denial_code)
+    logger.info("[Auditor] Procedure → %s", sd.procedure_denied)
 
     return sd
+
+
+# ============================================================
+# BATCH ENTRY POINT
+# ============================================================
+AUDITOR_BATCH_WORKERS = 8
+
+
+def run_auditor_batch(client: "genai.Client",
+                      cases: List[Tuple[str, str]],
+                      max_workers: int = AUDITOR_BATCH_WORKERS) -> List[Optional[StructuredDenial]]:
+    """
+    Run the Auditor over many (denial_path, policy_path) pairs concurrently.
+    Results come back in the same order as `cases`; a failed case is None.
+    """
+    if not cases:
+        return []
+
+    def _one(case: Tuple[str, str]) -> Optional[StructuredDenial]:
+        try:
+            return run_auditor_agent(client, case[0], case[1])
+        except Exception as e:
+            logger.error("[Auditor] Batch case %s failed: %s", case[0], e)
+            return None
+
+    logger.info("[Auditor] Batch of %d cases (%d workers)...", len(cases), max_workers)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cases))) as pool:
+        return list(pool.map(_one, cases))
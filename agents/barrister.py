@@ -1,38 +1,107 @@
 # agents/barrister.py — Enterprise-Stable Final Version
 
-from google import genai
-from google.genai import types
-from typing import Optional, Dict, Any, List
+from typing import TYPE_CHECKING, Optional, Dict, Any, List, Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import logging
-import json
 import os
+import queue
+import re
+import string
+import threading
 
 from .auditor import StructuredDenial
-from .clinician import EvidenceList
+from .clinician import ClinicalEvidence, EvidenceList
+from ._gemini import extract_text_from_gemini, get_cached_content, gemini_retrying, is_transient_error
+from . import _llm_cache
+from config.settings import BARRISTER_TERSE, DEBUG_DUMP
+from tools.io_utils import json_loads, save_llm_raw_dump
 
-logger = logging.getLogger("BarristerAgent")
-logger.setLevel(logging.INFO)
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
 
 BARRISTER_MODEL = "gemini-2.5-flash"
 DEBUG_OUTPUT_DIR = "data/output"
 
+# Debug dumps (ADVOCAI_DEBUG_DUMP=1) are written by one background thread,
+# capped so a huge repr(response) can't stall the run or fill the disk.
+_DEBUG_DUMP_LIMIT = 1_000_000
 
-# ============================================================
-# Unified Gemini Text Extractor
-# ============================================================
-def extract_text_from_gemini(resp) -> Optional[str]:
-    """
-    Extracts text from all possible Gemini response shapes.
-    """
-    if hasattr(resp, "text") and resp.text:
-        return resp.text.strip()
 
-    try:
-        parts = resp.candidates[0].content.parts
-        texts = [p.text for p in parts if getattr(p, "text", None)]
-        return "\n".join(texts).strip() or None
-    except Exception:
-        return None
+@lru_cache(maxsize=1)
+def _debug_executor() -> ThreadPoolExecutor:
+    """Created on the first dump, so runs without ADVOCAI_DEBUG_DUMP never start it."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="barrister-dump")
+
+
+def _dump_debug(name: str, content: str) -> None:
+    if DEBUG_DUMP:
+        _debug_executor().submit(
+            save_llm_raw_dump, content[:_DEBUG_DUMP_LIMIT], os.path.join(DEBUG_OUTPUT_DIR, name)
+        )
+
+
+# Request-invariant instruction (incl. the letter structure), built once at import
+_SYSTEM_INSTRUCTION = (
+    "You are the Barrister Agent — a senior appellate attorney specializing in "
+    "health insurance disputes. Your job is to produce a polished, persuasive, "
+    "fully structured APPEAL LETTER.\n\n"
+    "No placeholders. No incomplete sections. Use strong legal and medical reasoning.\n\n"
+    "REQUIRED LETTER STRUCTURE:\n"
+    "- Subject line referencing Procedure + Denial Code.\n"
+    "- Opening paragraph summarizing the denial and intent to appeal.\n"
+    "- Section I: Clinical argument using provided medical evidence.\n"
+    "- Section II: Legal/policy argument referencing statutory principles.\n"
+    "- Conclusion: Firm request for reversal + next steps.\n"
+)
+if BARRISTER_TERSE:
+    _SYSTEM_INSTRUCTION += (
+        "\nCONCISENESS: Use terse legal register. No pleasantries. Prefer fragments "
+        "over full sentences in bullets. Do not repeat headings verbatim. "
+        "Max 1 sentence per bullet.\n"
+    )
+
+# Compressed output needs less headroom; a tighter cap also trims straggler latency
+_MAX_OUTPUT_TOKENS = 1200 if BARRISTER_TERSE else 2048
+_TEMPERATURE = 0.3 if BARRISTER_TERSE else 0.35
+
+
+@lru_cache(maxsize=4)
+def _generate_config(cache_name: Optional[str]) -> "types.GenerateContentConfig":
+    """Barrister config only varies with the context-cache name → build once per name."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        system_instruction=None if cache_name else _SYSTEM_INSTRUCTION,
+        cached_content=cache_name,
+        max_output_tokens=_MAX_OUTPUT_TOKENS,
+        temperature=_TEMPERATURE,
+    )
+
+
+# Per-case prompt skeleton, parsed once; only the slots change per call
+_CASE_TEMPLATE = string.Template("""==============================================================
+1. INSURER DENIAL DETAILS
+==============================================================
+Procedure: $procedure
+Denial Code: $code
+Insurer’s Reason: "$reason"
+Policy Clause: "$clause"
+
+==============================================================
+2. CLINICAL EVIDENCE (SECTION I)
+==============================================================
+$clinical
+
+==============================================================
+3. REGULATORY FINDINGS (SECTION II)
+==============================================================
+$legal
+""")
+_PROMPT_HEADER = "\nDraft a complete, formal appeal letter.\n\n"
 
 
 # ============================================================
@@ -45,7 +114,7 @@ def extract_legal_points(reg: Any) -> List[Dict[str, Any]]:
 
     if isinstance(reg, str):
         try:
-            reg = json.loads(reg)
+            reg = json_loads(reg)
         except Exception:
             logger.error("Regulatory output string is invalid JSON.")
             return []
@@ -55,18 +124,27 @@ def extract_legal_points(reg: Any) -> List[Dict[str, Any]]:
         return []
 
     pts = reg.get("legal_points", [])
-    if isinstance(pts, list):
-        return [p for p in pts if isinstance(p, dict)]
-
     if isinstance(pts, dict):
-        return [pts]
+        pts = [pts]
+    if not isinstance(pts, list):
+        return []
 
-    return []
+    # a point with no statute, argument or summary would render as an empty bullet
+    return [
+        p for p in pts
+        if isinstance(p, dict) and (p.get("statute") or p.get("argument") or p.get("summary"))
+    ]
 
 
 # ============================================================
 # Clinical evidence formatter
 # ============================================================
+def _field(item: Any, name: str, default: str) -> Any:
+    """One lookup per field for either a model instance or a plain dict."""
+    value = item.get(name) if isinstance(item, dict) else getattr(item, name, None)
+    return value or default
+
+
 def format_clinical_evidence(ev: Any) -> str:
     """Handles EvidenceList, list, or empty structures gracefully."""
     try:
@@ -80,29 +158,64 @@ def format_clinical_evidence(ev: Any) -> str:
         if not items:
             return "- No clinical evidence provided."
 
-        lines = []
-        for it in items:
-            title = getattr(it, "article_title", None) or it.get("article_title", "Untitled Article")
-            summary = getattr(it, "summary_of_finding", None) or it.get("summary_of_finding", "No summary provided.")
-            pmid = getattr(it, "pubmed_id", None) or it.get("pubmed_id", "N/A")
-
-            lines.append(f"- **{title}:** {summary} (PubMed: {pmid})")
+        if all(isinstance(it, ClinicalEvidence) for it in items):
+            # Normal path (validated EvidenceList): plain attribute access
+            rows = (
+                (it.article_title or "Untitled Article",
+                 it.summary_of_finding or "No summary provided.",
+                 it.pubmed_id or "N/A")
+                for it in items
+            )
+        else:
+            # Defensive path: dicts (e.g. a reloaded checkpoint) or a mix
+            rows = (
+                (_field(it, "article_title", "Untitled Article"),
+                 _field(it, "summary_of_finding", "No summary provided."),
+                 _field(it, "pubmed_id", "N/A"))
+                for it in items
+            )
 
-        return "\n".join(lines)
+        return "\n".join(f"- **{title}:** {summary} (PubMed: {pmid})" for title, summary, pmid in rows)
 
     except Exception as e:
-        logger.error(f"Failed to format clinical evidence: {e}")
+        logger.error("Failed to format clinical evidence: %s", e)
         return "- Clinical evidence formatting error."
 
 
+# ============================================================
+# Case block (denial + supporting texts)
+# ============================================================
+def _render_case(denial: StructuredDenial, clinical: Any, regulatory: Any) -> str:
+    clinical_text = format_clinical_evidence(clinical)
+    legal_points = extract_legal_points(regulatory)
+
+    if legal_points:
+        legal_text = "\n".join(
+            f"- **{lp.get('statute', 'Statute')}** — {lp.get('summary', lp.get('argument', 'No summary'))}"
+            for lp in legal_points
+        )
+    else:
+        legal_text = "- No statutory or regulatory arguments produced."
+
+    return _CASE_TEMPLATE.substitute(
+        procedure=denial.procedure_denied,
+        code=denial.denial_code,
+        reason=denial.insurer_reason_snippet,
+        clause=denial.policy_clause_text,
+        clinical=clinical_text,
+        legal=legal_text,
+    )
+
+
 # ============================================================
 # FINAL — Barrister Agent (orchestrator-compatible)
 # ============================================================
 def run_barrister_agent(
-    client: genai.Client,
+    client: "genai.Client",
     denial_details: StructuredDenial = None,
     clinical_evidence: EvidenceList = None,
     regulatory_evidence: Dict[str, Any] = None,
+    on_chunk: Optional[Callable[[str], None]] = None,
     **kwargs
 ) -> Optional[str]:
     """
@@ -111,87 +224,57 @@ def run_barrister_agent(
     - denial_details
     - clinical_evidence
     - regulatory_evidence
+    - on_chunk: optional callback receiving letter text as it streams in
     - **kwargs for future compatibility
     """
 
-    # Rename for internal clarity
-    denial = denial_details
-    clinical = clinical_evidence
-    regulatory = regulatory_evidence
-
     logger.info("[Barrister] Preparing appeal generation...")
 
     # -------------------------------------------------
-    # Supporting Texts
+    # Prompt Assembly
     # -------------------------------------------------
-    clinical_text = format_clinical_evidence(clinical)
-    legal_points = extract_legal_points(regulatory)
-
-    if legal_points:
-        legal_text = "\n".join(
-            f"- **{lp.get('statute', 'Statute')}** — {lp.get('summary', lp.get('argument', 'No summary'))}"
-            for lp in legal_points
-        )
-    else:
-        legal_text = "- No statutory or regulatory arguments produced."
+    prompt = _PROMPT_HEADER + _render_case(denial_details, clinical_evidence, regulatory_evidence)
 
     # -------------------------------------------------
-    # System Instruction
+    # Model Invocation (streamed — letter renders as tokens arrive)
     # -------------------------------------------------
-    system_instruction = (
-        "You are the Barrister Agent — a senior appellate attorney specializing in "
-        "health insurance disputes. Your job is to produce a polished, persuasive, "
-        "fully structured APPEAL LETTER.\n\n"
-        "No placeholders. No incomplete sections. Use strong legal and medical reasoning."
-    )
+    # Static instruction lives in a context cache when enabled
+    cache_name = get_cached_content(client, BARRISTER_MODEL, _SYSTEM_INSTRUCTION)
 
-    # -------------------------------------------------
-    # Prompt Assembly
-    # -------------------------------------------------
-    prompt = f"""
-Draft a complete, formal appeal letter.
+    chunks: List[str] = []
+    config = _generate_config(cache_name)
 
-==============================================================
-1. INSURER DENIAL DETAILS
-==============================================================
-Procedure: {denial.procedure_denied}
-Denial Code: {denial.denial_code}
-Insurer’s Reason: "{denial.insurer_reason_snippet}"
-Policy Clause: "{denial.policy_clause_text}"
-
-==============================================================
-2. CLINICAL EVIDENCE (SECTION I)
-==============================================================
-{clinical_text}
-
-==============================================================
-3. REGULATORY FINDINGS (SECTION II)
-==============================================================
-{legal_text}
-
-==============================================================
-REQUIRED LETTER STRUCTURE
-==============================================================
-- Subject line referencing Procedure + Denial Code.
-- Opening paragraph summarizing the denial and intent to appeal.
-- Section I: Clinical argument using provided medical evidence.
-- Section II: Legal/policy argument referencing statutory principles.
-- Conclusion: Firm request for reversal + next steps.
-"""
-
-    # -------------------------------------------------
-    # Model Invocation
-    # -------------------------------------------------
-    try:
-        resp = client.models.generate_content(
+    # Identical inputs → identical letter; skip the call on a disk-cache hit
+    cache_key = _llm_cache.make_key(
+        BARRISTER_MODEL, _SYSTEM_INSTRUCTION, prompt, _MAX_OUTPUT_TOKENS, _TEMPERATURE
+    )
+    cached = _llm_cache.get("barrister", cache_key)
+    if cached:
+        logger.info("[Barrister] Reusing cached appeal letter.")
+        if on_chunk:
+            on_chunk(cached)
+        return cached
+
+    def _stream():
+        last = None
+        for last in client.models.generate_content_stream(
             model=BARRISTER_MODEL,
             contents=[prompt],
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                max_output_tokens=2048,
-                temperature=0.35,
-            ),
-        )
+            config=config,
+        ):
+            text = getattr(last, "text", None)
+            if not text:
+                continue
+            chunks.append(text)
+            if on_chunk:
+                on_chunk(text)
+        return last
+
+    try:
+        # Once text has reached on_chunk a retry would repeat it → only retry before that
+        last_chunk = gemini_retrying(
+            retry_when=lambda e: not chunks and is_transient_error(e)
+        )(_stream)
     except Exception as e:
         logger.exception("Barrister model API error: %s", e)
         return None
@@ -199,27 +282,148 @@ REQUIRED LETTER STRUCTURE
     # -------------------------------------------------
     # Extract Model Output
     # -------------------------------------------------
-    appeal_text = extract_text_from_gemini(resp)
+    appeal_text = "".join(chunks).strip()
 
     if not appeal_text:
         logger.error("[Barrister] Empty response from model.")
+        _dump_debug("barrister_raw.txt", repr(last_chunk))
+        return None
+
+    _dump_debug("barrister_raw.txt", appeal_text)
+
+    _llm_cache.put("barrister", cache_key, appeal_text)
+
+    logger.info("[Barrister] Appeal letter generated (%d chars).", len(appeal_text))
+    return appeal_text
+
+
+# ============================================================
+# Generator form (for callers that consume a stream)
+# ============================================================
+_STREAM_DONE = object()
+
 
+def stream_barrister_agent(client: "genai.Client", **kwargs) -> Iterator[str]:
+    """
+    Yield the appeal letter chunk by chunk as Gemini produces it.
+    Same keyword arguments as run_barrister_agent (minus on_chunk); caching,
+    retries and debug dumps behave identically. Yields nothing on failure.
+    """
+    kwargs.pop("on_chunk", None)
+    chunks: "queue.Queue" = queue.Queue()
+
+    def _produce():
         try:
-            os.makedirs(DEBUG_OUTPUT_DIR, exist_ok=True)
-            with open(f"{DEBUG_OUTPUT_DIR}/barrister_raw.txt", "w", encoding="utf-8") as fh:
-                fh.write(repr(resp))
-        except Exception:
-            pass
+            run_barrister_agent(client, on_chunk=chunks.put, **kwargs)
+        finally:
+            chunks.put(_STREAM_DONE)
 
-        return None
+    threading.Thread(target=_produce, daemon=True).start()
+    while True:
+        item = chunks.get()
+        if item is _STREAM_DONE:
+            return
+        yield item
 
-    # Save raw
-    try:
-        os.makedirs(DEBUG_OUTPUT_DIR, exist_ok=True)
-        with open(f"{DEBUG_OUTPUT_DIR}/barrister_raw.txt", "w", encoding="utf-8") as fh:
-            fh.write(appeal_text)
-    except:
-        pass
 
-    logger.info(f"[Barrister] Appeal letter generated ({len(appeal_text)} chars).")
-    return appeal_text
+# ============================================================
+# Batch entry point
+# ============================================================
+BARRISTER_BATCH_WORKERS = 8
+
+
+def run_barrister_batch(
+    client: "genai.Client",
+    cases: List[Dict[str, Any]],
+    max_workers: int = BARRISTER_BATCH_WORKERS,
+) -> List[Optional[str]]:
+    """
+    Draft appeals for many cases concurrently. Each case is a dict of
+    run_barrister_agent keyword arguments (denial_details, clinical_evidence,
+    regulatory_evidence). Letters come back in input order; failures are None.
+    """
+    if not cases:
+        return []
+
+    def _one(case: Dict[str, Any]) -> Optional[str]:
+        try:
+            return run_barrister_agent(client, **case)
+        except Exception as e:
+            logger.error("[Barrister] Batch case failed: %s", e)
+            return None
+
+    logger.info("[Barrister] Batch of %d cases (%d workers)...", len(cases), max_workers)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cases))) as pool:
+        return list(pool.map(_one, cases))
+
+
+# ============================================================
+# Packed entry point (several cases per request)
+# ============================================================
+BARRISTER_PACK_SIZE = 5
+
+_PACKED_SYSTEM_INSTRUCTION = _SYSTEM_INSTRUCTION + (
+    "\nYou will receive several numbered cases. Write one complete letter per case "
+    "and output each letter between <LETTER id=N>...</LETTER> tags, where N is the "
+    "case number.\n"
+)
+_LETTER_RE = re.compile(r"<LETTER id=(\d+)>(.*?)</LETTER>", re.S)
+
+
+def _run_pack(client: "genai.Client", pack: List[Dict[str, Any]]) -> List[Optional[str]]:
+    from google.genai import types
+
+    prompt = (
+        f"Draft {len(pack)} complete, formal appeal letters, one per case.\n\n"
+        + "\n---\n".join(
+            f"CASE {i}:\n" + _render_case(
+                c.get("denial_details"), c.get("clinical_evidence"), c.get("regulatory_evidence")
+            )
+            for i, c in enumerate(pack, 1)
+        )
+    )
+
+    letters: Dict[int, str] = {}
+    try:
+        resp = gemini_retrying()(
+            client.models.generate_content,
+            model=BARRISTER_MODEL,
+            contents=[prompt],
+            config=types.GenerateContentConfig(
+                system_instruction=_PACKED_SYSTEM_INSTRUCTION,
+                max_output_tokens=_MAX_OUTPUT_TOKENS * len(pack),
+                temperature=_TEMPERATURE,
+            ),
+        )
+        text = extract_text_from_gemini(resp) or ""
+        letters = {int(n): body.strip() for n, body in _LETTER_RE.findall(text)}
+    except Exception as e:
+        logger.error("[Barrister] Packed request failed: %s", e)
+
+    results: List[Optional[str]] = []
+    for i, case in enumerate(pack, 1):
+        letter = letters.get(i)
+        if not letter:
+            # Missing/unparseable letter → single-case mode for just this one
+            logger.warning("[Barrister] No letter for packed case %d — retrying alone.", i)
+            letter = run_barrister_agent(client, **case)
+        results.append(letter)
+    return results
+
+
+def run_barrister_packed(
+    client: "genai.Client",
+    cases: List[Dict[str, Any]],
+    pack_size: int = BARRISTER_PACK_SIZE,
+) -> List[Optional[str]]:
+    """
+    Draft appeals for many cases, `pack_size` cases per Gemini request, so the
+    system instruction is paid once per pack instead of once per case.
+    Cases are run_barrister_agent keyword dicts; letters come back in input order.
+    """
+    results: List[Optional[str]] = []
+    for start in range(0, len(cases), pack_size):
+        pack = cases[start:start + pack_size]
+        logger.info("[Barrister] Packed request: cases %d–%d", start + 1, start + len(pack))
+        results.extend(_run_pack(client, pack))
+    return results
@@ -1,21 +1,35 @@
 # agents/clinician.py — Production-Ready, Crash-Proof Clinician Agent
 
-from google import genai
-from google.genai import types
-from pydantic import BaseModel, Field
-from typing import List, Optional
-import json
+from pydantic import BaseModel, Field, ValidationError
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+import os
 import re
+import random
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 from .auditor import StructuredDenial
+from config.settings import ENABLE_QUERY_TEMPLATES, QUERY_TEMPLATES_PATH
+from tools.io_utils import json_dumps, json_loads
 from tools.pubmed_search import pubmed_search
+from ._gemini import gemini_retrying
+from . import _llm_cache
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
 
 CLINICIAN_MODEL = "gemini-2.5-flash"
 
+# Kept short: the tool declaration already describes pubmed_search, and the
+# synthesis step's structure is enforced by response_schema.
+_SYSTEM_INSTRUCTION = "Medical researcher. Call pubmed_search first, then synthesize."
+
 
 # ============================================================
 # Pydantic Models
@@ -30,21 +44,70 @@ class EvidenceList(BaseModel):
     root: List[ClinicalEvidence] = Field(default_factory=list)
 
 
+_EVIDENCE_SCHEMA = EvidenceList.model_json_schema()
+
+
+# Request-invariant configs, built on first use (google.genai is imported lazily)
+@lru_cache(maxsize=1)
+def _tool_config() -> "types.GenerateContentConfig":
+    """
+    Turn 1: the model MUST call pubmed_search (mode ANY). Automatic function
+    calling is off so the SDK doesn't run the tool and a hidden second turn
+    itself — we execute it once and send the result back in turn 2.
+    """
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        system_instruction=_SYSTEM_INSTRUCTION,
+        tools=[pubmed_search],        # function object
+        tool_config=types.ToolConfig(
+            function_calling_config=types.FunctionCallingConfig(
+                mode="ANY", allowed_function_names=["pubmed_search"]
+            )
+        ),
+        automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True),
+        temperature=0.0,
+    )
+
+
+@lru_cache(maxsize=1)
+def _synthesis_config() -> "types.GenerateContentConfig":
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=_EVIDENCE_SCHEMA,
+    )
+
+
 # ============================================================
 # Helper Functions
 # ============================================================
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+
 def _clean_json(text: str) -> str:
     """Remove backticks, markdown fences, etc."""
     if not text:
         return ""
-    t = text.strip()
-    t = re.sub(r"```(?:json)?", "", t).replace("```", "")
-    return t.strip()
+    return _FENCE_RE.sub("", text.strip()).strip()
+
+
+def _parse_evidence(raw: str) -> EvidenceList:
+    """Single-pass parse of the (normally pure JSON) response; de-fence only on failure."""
+    try:
+        return EvidenceList.model_validate_json(raw)
+    except Exception:
+        return EvidenceList.model_validate_json(_clean_json(raw))
 
 
 def _derive_query(denial: StructuredDenial) -> str:
     """Generate an intelligent default PubMed query."""
-    reason = denial.insurer_reason_snippet.lower()
+    return _baseline_query(denial.procedure_denied, denial.insurer_reason_snippet)
+
+
+def _baseline_query(procedure_denied: str, insurer_reason_snippet: str) -> str:
+    reason = insurer_reason_snippet.lower()
     tags = []
 
     if "asymptomatic" in reason:
@@ -53,35 +116,153 @@ def _derive_query(denial: StructuredDenial) -> str:
     if "experimental" in reason or "unproven" in reason:
         tags.append("clinical utility established")
 
-    base = f"{denial.procedure_denied} clinical efficacy"
+    base = f"{procedure_denied} clinical efficacy"
     return base + " " + " ".join(tags) if tags else base
 
 
+# ------------------------------------------------------------
+# Learned query templates
+# ------------------------------------------------------------
+# For a given procedure and reason signature the tool-selection call keeps
+# picking the same query (temperature 0). Once it has done so
+# _TEMPLATE_MIN_OBSERVATIONS times in a row, reuse it and skip that Gemini
+# round trip; a small sample of calls still asks the model, to refresh.
+_KEY_REASONS = ("asymptomatic", "experimental", "unproven")
+_TEMPLATE_MIN_OBSERVATIONS = 2
+_TEMPLATE_REFRESH_RATE = 1 / 20
+
+_templates: Optional[Dict[str, Dict[str, Any]]] = None
+_templates_lock = threading.Lock()
+
+
+def _template_key(denial: StructuredDenial) -> str:
+    reason = denial.insurer_reason_snippet.lower()
+    signature = ",".join(k for k in _KEY_REASONS if k in reason)
+    return f"{denial.procedure_denied.strip().lower()}|{signature}"
+
+
+def _load_templates() -> Dict[str, Dict[str, Any]]:
+    global _templates
+    if _templates is None:
+        try:
+            with open(QUERY_TEMPLATES_PATH, "rb") as f:
+                _templates = json_loads(f.read())
+        except FileNotFoundError:
+            _templates = {}
+        except Exception as e:
+            logger.warning("[Clinician] Ignoring unreadable query templates: %s", e)
+            _templates = {}
+    return _templates
+
+
+def _template_query(denial: StructuredDenial) -> Optional[str]:
+    """Learned query for this denial's template, or None (unknown, unconfirmed, or sampled for refresh)."""
+    if not ENABLE_QUERY_TEMPLATES or random.random() < _TEMPLATE_REFRESH_RATE:
+        return None
+    with _templates_lock:
+        entry = _load_templates().get(_template_key(denial))
+    if entry and entry.get("seen", 0) >= _TEMPLATE_MIN_OBSERVATIONS:
+        return entry.get("query") or None
+    return None
+
+
+def _record_template(denial: StructuredDenial, query: str) -> None:
+    """Count an LLM-chosen query towards its template and persist (temp file + os.replace)."""
+    if not ENABLE_QUERY_TEMPLATES:
+        return
+    with _templates_lock:
+        templates = _load_templates()
+        key = _template_key(denial)
+        entry = templates.get(key)
+        if entry and entry.get("query") == query:
+            entry["seen"] = entry.get("seen", 0) + 1
+        else:
+            templates[key] = {"query": query, "seen": 1}
+
+        try:
+            os.makedirs(os.path.dirname(QUERY_TEMPLATES_PATH), exist_ok=True)
+            tmp = QUERY_TEMPLATES_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(json_dumps(templates, indent=True))
+            os.replace(tmp, QUERY_TEMPLATES_PATH)
+        except Exception as e:
+            logger.warning("[Clinician] Could not save query templates: %s", e)
+
+
 # ============================================================
 # MAIN AGENT
 # ============================================================
-def run_clinician_agent(client: genai.Client, denial_details: StructuredDenial) -> EvidenceList:
+# Evidence for a (procedure, code, reason) triple rarely changes between
+# appeals → memoize validated results in-process, and on disk via _llm_cache.
+_EVIDENCE_MEMO_SIZE = 512
+_EVIDENCE_MEMO: "OrderedDict[str, str]" = OrderedDict()
+_EVIDENCE_MEMO_LOCK = threading.Lock()
+
+
+def _evidence_key(denial: StructuredDenial) -> str:
+    return _llm_cache.make_key(
+        CLINICIAN_MODEL,
+        _SYSTEM_INSTRUCTION,
+        denial.procedure_denied,
+        denial.denial_code,
+        denial.insurer_reason_snippet,
+    )
+
+
+def _cached_evidence(key: str) -> Optional[EvidenceList]:
+    with _EVIDENCE_MEMO_LOCK:
+        cached = _EVIDENCE_MEMO.get(key)
+        if cached is not None:
+            _EVIDENCE_MEMO.move_to_end(key)
+    if cached is None:
+        cached = _llm_cache.get("clinician_evidence", key)
+    if cached is None:
+        return None
+    try:
+        return EvidenceList.model_validate_json(cached)
+    except (ValidationError, ValueError) as e:
+        # Stale schema or a truncated cache file → treat as a miss
+        logger.debug("[Clinician] Ignoring unreadable cached evidence %s: %s", key[:12], e)
+        return None
+
+
+def _remember_evidence(key: str, evidence: EvidenceList) -> None:
+    # empty lists usually mean a PubMed/LLM failure → not worth pinning
+    if not evidence.root:
+        return
+    payload = evidence.model_dump_json()
+    with _EVIDENCE_MEMO_LOCK:
+        _EVIDENCE_MEMO[key] = payload
+        if len(_EVIDENCE_MEMO) > _EVIDENCE_MEMO_SIZE:
+            _EVIDENCE_MEMO.popitem(last=False)
+    _llm_cache.put("clinician_evidence", key, payload)
+
+
+def run_clinician_agent(client: "genai.Client", denial_details: StructuredDenial) -> EvidenceList:
     """
     SAFETY GUARANTEE:
       → ALWAYS returns EvidenceList (never None).
       → Even if PubMed fails or LLM fails.
     """
+    key = _evidence_key(denial_details)
+
+    cached = _cached_evidence(key)
+    if cached is not None:
+        print("[Clinician] Reusing cached evidence for this procedure/denial.")
+        return cached
 
+    evidence = _run_clinician_uncached(client, denial_details)
+    _remember_evidence(key, evidence)
+    return evidence
+
+
+def _run_clinician_uncached(client: "genai.Client", denial_details: StructuredDenial) -> EvidenceList:
     print("\n[Clinician] Preparing initial search query...")
     initial_query = _derive_query(denial_details)
 
     # --------------------------------------------------------
-    # STEP 1: Ask Gemini for the best PubMed search query
+    # STEP 1: Gemini picks the PubMed query (forced tool call)
     # --------------------------------------------------------
-    system_instruction = (
-        "You are the Clinician Agent. Your job is to identify high-quality "
-        "peer-reviewed evidence that the denied procedure is clinically effective, "
-        "safe, and not experimental.\n\n"
-        "You MUST call the 'pubmed_search' tool with the best search query.\n"
-        "After the tool returns article abstracts, you will synthesize them into "
-        "EvidenceList JSON according to the schema.\n"
-    )
-
     tool_prompt = f"""
 Denied Procedure: {denial_details.procedure_denied}
 Insurer Reason: {denial_details.insurer_reason_snippet}
@@ -89,43 +270,53 @@ Insurer Reason: {denial_details.insurer_reason_snippet}
 Baseline query: "{initial_query}"
 
 Call the 'pubmed_search' tool with your final optimized query.
+Then synthesize the returned articles into the EvidenceList schema, summarizing
+each article's evidence that the procedure is clinically effective and safe.
+If no articles are returned, return an empty list.
 """
 
-    print(f"[Clinician] Asking Gemini to choose a query…")
+    model_turn: List[Optional["types.Content"]] = [None]
 
-    try:
-        llm_first = client.models.generate_content(
+    def _choose_query() -> Optional[str]:
+        llm_first = gemini_retrying()(
+            client.models.generate_content,
             model=CLINICIAN_MODEL,
             contents=[tool_prompt],
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                tools=[pubmed_search],        # function object
-            ),
+            config=_tool_config(),
         )
-        # --------------------------------------------------------
-        # Correct extraction of function call for Gemini SDK
-        # --------------------------------------------------------
-        call = None
+        content = llm_first.candidates[0].content
+        for p in content.parts or []:
+            call = getattr(p, "function_call", None)
+            if call and call.name == "pubmed_search":
+                model_turn[0] = content
+                return (call.args or {}).get("query") or None
+        return None
+
+    final_query = _template_query(denial_details)
+    if final_query:
+        print(f"[Clinician] Using learned query template: {final_query}")
+    else:
+        print(f"[Clinician] Asking Gemini to choose a query…")
         try:
-            parts = llm_first.candidates[0].content.parts
-            for p in parts:
-                if hasattr(p, "function_call") and p.function_call:
-                    call = p.function_call
-                    break
-        except Exception:
-            call = None
-
-        if call and call.name == "pubmed_search":
-            final_query = call.args.get("query", initial_query)
+            final_query = _llm_cache.cached_generate(
+                "clinician_query",
+                _llm_cache.make_key(CLINICIAN_MODEL, _SYSTEM_INSTRUCTION, tool_prompt, "ANY"),
+                _choose_query,
+            )
+        except Exception as e:
+            print(f"[Clinician ERROR] Failed to generate tool call: {e}")
+            return EvidenceList(root=[])
+
+        if final_query:
             print(f"[Clinician] Gemini selected query: {final_query}")
+            # Only a live call is a new observation; an _llm_cache replay is not
+            if model_turn[0] is not None:
+                _record_template(denial_details, final_query)
         else:
-            print("[Clinician] No function_call detected. Falling back to baseline query.")
+            # mode=ANY makes this rare (e.g. a call without a query argument)
+            print("[Clinician] No usable function_call. Falling back to baseline query.")
             final_query = initial_query
-
-
-    except Exception as e:
-        print(f"[Clinician ERROR] Failed to generate tool call: {e}")
-        return EvidenceList(root=[])
+            model_turn[0] = None
 
     # --------------------------------------------------------
     # STEP 2: Execute PubMed Tool
@@ -148,34 +339,43 @@ Call the 'pubmed_search' tool with your final optimized query.
         print("[Clinician] PubMed returned zero articles. Will synthesize empty evidence list.")
 
     # --------------------------------------------------------
-    # STEP 3: Synthesize structured JSON with Gemini
+    # STEP 3: Send the tool result back in the same conversation
     # --------------------------------------------------------
-    synthesis_prompt = (
-        "Synthesize the PubMed results into the EvidenceList schema.\n"
-        "If no articles are available, return an empty list.\n\n"
-        f"TOOL OUTPUT:\n{json.dumps(articles, indent=2)}"
-    )
-
     print("[Clinician] Sending tool output to Gemini for synthesis…")
 
+    cache_key = _llm_cache.make_key(CLINICIAN_MODEL, tool_prompt, final_query, articles, _EVIDENCE_SCHEMA)
+
     try:
-        llm_second = client.models.generate_content(
-            model=CLINICIAN_MODEL,
-            contents=[synthesis_prompt],
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                response_mime_type="application/json",
-                response_schema=EvidenceList.model_json_schema(),
-            ),
-        )
+        raw_json = _llm_cache.get("clinician_synthesis", cache_key)
+        if raw_json is None:
+            from google.genai import types
+
+            # Cached query / baseline fallback → rebuild the model's call turn
+            call_turn = model_turn[0] or types.Content(
+                role="model",
+                parts=[types.Part.from_function_call(name="pubmed_search", args={"query": final_query})],
+            )
+            llm_second = gemini_retrying()(
+                client.models.generate_content,
+                model=CLINICIAN_MODEL,
+                contents=[
+                    types.Content(role="user", parts=[types.Part.from_text(text=tool_prompt)]),
+                    call_turn,
+                    types.Content(role="user", parts=[types.Part.from_function_response(
+                        name="pubmed_search", response={"result": articles}
+                    )]),
+                ],
+                config=_synthesis_config(),
+            )
+            raw_json = llm_second.text if hasattr(llm_second, "text") else None
 
-        raw_json = llm_second.text if hasattr(llm_second, "text") else None
         if not raw_json:
             print("[Clinician] LLM returned nothing. Using empty evidence list.")
             return EvidenceList(root=[])
 
-        clean = _clean_json(raw_json)
-        evidence = EvidenceList.model_validate_json(clean)
+        evidence = _parse_evidence(raw_json)
+        # only responses that validated are worth replaying
+        _llm_cache.put("clinician_synthesis", cache_key, raw_json)
 
         print(f"[Clinician] Evidence synthesized. Count: {len(evidence.root)}")
         return evidence
@@ -184,3 +384,159 @@ Call the 'pubmed_search' tool with your final optimized query.
         print(f"[Clinician ERROR] Synthesis failed: {e}")
         logger.exception("Clinician synthesis error:")
         return EvidenceList(root=[])
+
+
+# ============================================================
+# BATCH ENTRY POINT
+# ============================================================
+CLINICIAN_BATCH_WORKERS = 8
+
+
+def run_clinician_batch(client: "genai.Client",
+                        denials: List[StructuredDenial],
+                        max_workers: int = CLINICIAN_BATCH_WORKERS) -> List[EvidenceList]:
+    """
+    Run the Clinician for many denials concurrently (Gemini + PubMed calls are
+    network-bound). Results are in input order; each is an EvidenceList,
+    empty on failure, same as run_clinician_agent.
+    """
+    if not denials:
+        return []
+
+    def _one(denial: StructuredDenial) -> EvidenceList:
+        try:
+            return run_clinician_agent(client, denial)
+        except Exception as e:
+            logger.error("[Clinician] Batch case failed: %s", e)
+            return EvidenceList(root=[])
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(denials))) as pool:
+        return list(pool.map(_one, denials))
+
+
+# ============================================================
+# PACKED ENTRY POINT (several denials per request)
+# ============================================================
+CLINICIAN_PACK_SIZE = 5
+
+_PACKED_SYSTEM_INSTRUCTION = (
+    "Medical researcher. You will receive several numbered cases. Call pubmed_search "
+    "once per case, in case order, then synthesize one evidence list per case."
+)
+
+
+class _PackedEvidence(BaseModel):
+    cases: List[EvidenceList] = Field(default_factory=list)
+
+
+_PACKED_SCHEMA = _PackedEvidence.model_json_schema()
+
+
+def _run_clinician_pack(client: "genai.Client", pack: List[StructuredDenial]) -> List[Optional[EvidenceList]]:
+    """
+    One tool-call turn for the whole pack (one pubmed_search call per case),
+    the searches run concurrently, then one synthesis turn returns every
+    case's EvidenceList. Cases the model drops come back as None.
+    """
+    from google.genai import types
+
+    baseline = [_derive_query(d) for d in pack]
+    prompt = f"For EACH of the following {len(pack)} denied procedures, call 'pubmed_search' " \
+             "with an optimized query, in case order.\n\n" + "\n".join(
+        f'CASE {i}:\nDenied Procedure: {d.procedure_denied}\n'
+        f'Insurer Reason: {d.insurer_reason_snippet}\nBaseline query: "{q}"\n'
+        for i, (d, q) in enumerate(zip(pack, baseline), 1)
+    )
+
+    try:
+        first = gemini_retrying()(
+            client.models.generate_content,
+            model=CLINICIAN_MODEL,
+            contents=[prompt],
+            config=_tool_config().model_copy(update={"system_instruction": _PACKED_SYSTEM_INSTRUCTION}),
+        )
+        calls = [
+            p.function_call for p in (first.candidates[0].content.parts or [])
+            if getattr(p, "function_call", None) and p.function_call.name == "pubmed_search"
+        ]
+        queries = [(c.args or {}).get("query") for c in calls]
+    except Exception as e:
+        logger.error("[Clinician] Packed tool call failed: %s", e)
+        queries = []
+
+    if len(queries) != len(pack) or not all(queries):
+        # calls can't be matched to cases → baseline query for every case
+        logger.warning("[Clinician] Got %d usable calls for %d cases — using baseline queries.",
+                       len(queries), len(pack))
+        queries = baseline
+
+    def _search(query: str) -> list:
+        try:
+            articles = pubmed_search(query)
+            return articles if isinstance(articles, list) else []
+        except Exception as e:
+            logger.error("[Clinician] PubMed failed for %r: %s", query, e)
+            return []
+
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        results = list(pool.map(_search, queries))
+
+    try:
+        second = gemini_retrying()(
+            client.models.generate_content,
+            model=CLINICIAN_MODEL,
+            contents=[
+                types.Content(role="user", parts=[types.Part.from_text(text=prompt)]),
+                types.Content(role="model", parts=[
+                    types.Part.from_function_call(name="pubmed_search", args={"query": q})
+                    for q in queries
+                ]),
+                types.Content(role="user", parts=[
+                    *(types.Part.from_function_response(name="pubmed_search", response={"result": a})
+                      for a in results),
+                    types.Part.from_text(
+                        text=f"Return one evidence list per case, in case order ({len(pack)} in total)."
+                    ),
+                ]),
+            ],
+            config=types.GenerateContentConfig(
+                system_instruction=_PACKED_SYSTEM_INSTRUCTION,
+                response_mime_type="application/json",
+                response_schema=_PACKED_SCHEMA,
+            ),
+        )
+        packed = _PackedEvidence.model_validate_json(_clean_json(second.text or ""))
+    except Exception as e:
+        logger.error("[Clinician] Packed synthesis failed: %s", e)
+        return [None] * len(pack)
+
+    if len(packed.cases) != len(pack):
+        logger.warning("[Clinician] Packed synthesis returned %d lists for %d cases.",
+                       len(packed.cases), len(pack))
+        return [None] * len(pack)
+    return list(packed.cases)
+
+
+def run_clinician_packed(client: "genai.Client",
+                         denials: List[StructuredDenial],
+                         pack_size: int = CLINICIAN_PACK_SIZE) -> List[EvidenceList]:
+    """
+    Gather evidence for many denials with two Gemini round trips per pack
+    (instead of two per denial). Cached denials are answered from the
+    evidence memo; a pack whose response can't be matched to its cases falls
+    back to run_clinician_agent per case. Results are in input order.
+    """
+    keys = [_evidence_key(d) for d in denials]
+    results: List[Optional[EvidenceList]] = [_cached_evidence(k) for k in keys]
+    pending = [i for i, r in enumerate(results) if r is None]
+
+    for start in range(0, len(pending), pack_size):
+        idx = pending[start:start + pack_size]
+        logger.info("[Clinician] Packed request: %d cases", len(idx))
+        for i, evidence in zip(idx, _run_clinician_pack(client, [denials[i] for i in idx])):
+            if evidence is None:
+                evidence = run_clinician_agent(client, denials[i])
+            else:
+                _remember_evidence(keys[i], evidence)
+            results[i] = evidence
+    return results
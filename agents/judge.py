@@ -10,11 +10,19 @@ from datetime import datetime
 import difflib
 import logging
 import os
-import json
 import re
 
-logger = logging.getLogger("JudgeAgent")
-logger.setLevel(logging.INFO)
+from config.settings import JUDGE_MATCHER
+from tools.io_utils import json_loads
+
+# rapidfuzz (optional) gives a tight C-level upper bound on difflib ratios
+try:
+    from rapidfuzz.fuzz import ratio as _rf_ratio
+    _HAS_RAPIDFUZZ = True
+except ImportError:
+    _HAS_RAPIDFUZZ = False
+
+logger = logging.getLogger(__name__)
 
 
 # ============================================================
@@ -55,44 +63,47 @@ class JudgeScorecard(BaseModel):
             return values
 
         v = subs if isinstance(subs, dict) else subs.model_dump()
+        values["overall_score"], values["status"] = _overall(v)
+        return values
 
-        overall = int(
-            (
-                v["factual_accuracy"]
-                + v["citation_consistency"]
-                + v["logical_adequacy"]
-                + v["tone_professionalism"]
-                - v["hallucination_risk"]
-            ) / 5
-        )
 
-        values["overall_score"] = overall
-        values["status"] = "approve" if overall >= 85 else "needs_revision"
-        return values
+def _overall(v: Dict[str, int]) -> tuple:
+    """(overall_score, status) from a sub-scores dict."""
+    # four positive sub-scores minus the hallucination penalty → mean of four,
+    # clamped to 0–100
+    total = (
+        v["factual_accuracy"]
+        + v["citation_consistency"]
+        + v["logical_adequacy"]
+        + v["tone_professionalism"]
+        - v["hallucination_risk"]
+    )
+    overall = max(0, min(100, total // 4))
+    return overall, "approve" if overall >= 85 else "needs_revision"
 
 
 # ============================================================
 # Loaders
 # ============================================================
 def _load_json(path):
-    if not os.path.exists(path):
+    try:
+        with open(path, "rb") as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
         logger.warning(f"[Judge] Missing JSON at {path}")
         return None
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
     except Exception as e:
         logger.error(f"[Judge] JSON load failed: {e}")
         return None
 
 
 def _load_text(path):
-    if not os.path.exists(path):
-        logger.warning(f"[Judge] Missing text at {path}")
-        return None
     try:
         with open(path, "r", encoding="utf-8") as f:
             return f.read()
+    except FileNotFoundError:
+        logger.warning(f"[Judge] Missing text at {path}")
+        return None
     except Exception as e:
         logger.error(f"[Judge] Failed to read: {e}")
         return None
@@ -110,94 +121,173 @@ def load_all_inputs(session_dir):
 # ============================================================
 # Text utilities
 # ============================================================
+_NL_RE = re.compile(r"[\r\n]+")
+_SENT_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\[])")
+
+
 def split_sentences(text: str) -> List[str]:
     if not text:
         return []
-    text = re.sub(r"[\r\n]+", " ", text)
-    parts = re.split(r"(?<=[.!?])\s+(?=[A-Z0-9])", text)
-    return [p.strip() for p in parts if p.strip()]
-
-
-def classify_sentences(sentences: List[str]) -> List[Dict[str, Any]]:
-    claim_keywords = [
-        "evidence", "clinical", "study", "trial", "research",
-        "medically necessary", "medical necessity",
-        "denial", "policy", "regulation", "coverage",
-        "should be covered", "effective", "beneficial",
-        "recommended", "indicated", "supports", "argue",
-        "counter", "compliant", "unproven", "experimental",
-    ]
-
-    out = []
-    for i, s in enumerate(sentences):
-        lower = s.lower()
-        is_claim = any(k in lower for k in claim_keywords)
-        out.append({
+    parts = _SENT_RE.split(_NL_RE.sub(" ", text))
+    return [p for p in (part.strip() for part in parts) if p]
+
+
+_CLAIM_KEYWORDS = [
+    "evidence", "clinical", "study", "trial", "research",
+    "medically necessary", "medical necessity",
+    "denial", "policy", "regulation", "coverage",
+    "should be covered", "effective", "beneficial",
+    "recommended", "indicated", "supports", "argue",
+    "counter", "compliant", "unproven", "experimental",
+]
+# One alternation → a single C-level scan per sentence instead of ~20 `in` checks.
+# IGNORECASE so un-lowered sentences can be searched without a lowercase copy.
+# Leading \b only: keywords must start a word ("counter" ∉ "encounter") but
+# may still take suffixes ("trials", "supported").
+_CLAIM_RE = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in _CLAIM_KEYWORDS) + ")", re.IGNORECASE)
+
+
+def classify_sentences(sentences: List[str],
+                       lowered: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """`lowered` (parallel to `sentences`) is optional; the match is case-insensitive either way."""
+    if lowered is None:
+        lowered = sentences
+    return [
+        {
             "sentence_index": i,
             "sentence": s,
-            "label": "CLAIM" if is_claim else "NON_CLAIM"
-        })
-    return out
+            "label": "CLAIM" if _CLAIM_RE.search(lc) else "NON_CLAIM"
+        }
+        for i, (s, lc) in enumerate(zip(sentences, lowered))
+    ]
 
 
 # ============================================================
 # Evidence linking
 # ============================================================
-def link_evidence(sentence, auditor, clinician, regulatory):
-    s = sentence.lower()
-    matches = {"auditor": [], "clinician": [], "regulatory": []}
+def _matcher(text: str) -> difflib.SequenceMatcher:
+    """
+    SequenceMatcher with the evidence text as seq2: its index (b2j) is built
+    once per chunk instead of once per (sentence, chunk) pair.
+    """
+    m = difflib.SequenceMatcher(None)
+    m.set_seq2(text)
+    return m
 
-    # Auditor evidence
-    if auditor:
-        for chunk in auditor.get("raw_evidence_chunks", []):
-            try:
-                ratio = difflib.SequenceMatcher(None, s, chunk.lower()).ratio()
-                if ratio > 0.35:
-                    matches["auditor"].append(chunk[:60])
-            except:
-                pass
 
-        dc = auditor.get("denial_code", "").lower()
-        if dc and dc in s:
-            matches["auditor"].append(f"DenialCode:{dc}")
+def _ratio_above(m: difflib.SequenceMatcher, s: str, threshold: float) -> bool:
+    """ratio() > threshold, skipping the full match when a cheap upper bound rules it out."""
+    m.set_seq1(s)
+    if not m.real_quick_ratio() > threshold:
+        return False
+    if _HAS_RAPIDFUZZ:
+        # Indel similarity = 2·LCS/(len(a)+len(b)) ≥ difflib's ratio (its matching
+        # blocks are a common subsequence) → an exact, C-speed reject test
+        if _rf_ratio(s, m.b) / 100 <= threshold - 1e-9:
+            return False
+    elif not m.quick_ratio() > threshold:
+        return False
+    return m.ratio() > threshold
+
+
+# Opt-in alternative to difflib: containment of word 3-shingle sets. Set
+# intersection is linear, but it only fires on shared phrases, so it is
+# stricter than the character-level ratios and not a drop-in equivalent.
+_USE_SHINGLES = JUDGE_MATCHER == "shingle"
+_SHINGLE_K = 3
+
+# Per-source cutoffs: difflib ratio, and shingle containment. The shingle
+# auditor cutoff is the one that best agreed with difflib on the sample cases;
+# clinician/regulatory had no overlapping shingles there, so they keep 0.2.
+_RATIO_THRESHOLDS = {"auditor": 0.35, "clinician": 0.25, "regulatory": 0.22}
+_SHINGLE_THRESHOLDS = {"auditor": 0.1, "clinician": 0.2, "regulatory": 0.2}
+
+
+def shingles(text: str, k: int = _SHINGLE_K) -> frozenset:
+    toks = text.split()
+    if len(toks) < k:
+        return frozenset([" ".join(toks)]) if toks else frozenset()
+    return frozenset(" ".join(toks[i:i + k]) for i in range(len(toks) - k + 1))
+
+
+def _containment(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / max(1, min(len(a), len(b)))
+
 
+_evidence_repr = shingles if _USE_SHINGLES else _matcher
+
+
+def build_evidence_index(auditor, clinician, regulatory) -> Dict[str, Any]:
+    """Lowercase + index every evidence source once per letter."""
+    index = {"auditor_chunks": [], "denial_code": "", "snippet_core": [],
+             "clinician": [], "regulatory": []}
+
+    if auditor:
+        for chunk in auditor.get("raw_evidence_chunks", []):
+            if isinstance(chunk, str):
+                index["auditor_chunks"].append((chunk[:60], _evidence_repr(chunk.lower())))
+        index["denial_code"] = auditor.get("denial_code", "").lower()
         snippet = (auditor.get("insurer_reason_snippet") or "").lower()
-        if snippet:
-            core = snippet.split()[:4]
-            if any(w in s for w in core):
-                matches["auditor"].append("InsurerReasonSnippet")
+        index["snippet_core"] = snippet.split()[:4]
 
-    # Clinician evidence
     if clinician and isinstance(clinician, dict):
         for entry in clinician.get("root", []):
+            pmid = str(entry.get("pubmed_id") or "").lower()
             combined = " ".join([
                 (entry.get("article_title") or "").lower(),
                 (entry.get("summary_of_finding") or "").lower(),
-                str(entry.get("pubmed_id") or "").lower()
+                pmid
             ])
+            index["clinician"].append((pmid, _evidence_repr(combined)))
 
-            ratio = difflib.SequenceMatcher(None, s, combined).ratio()
-            pmid = str(entry.get("pubmed_id") or "").lower()
-            if pmid and pmid in s:
-                ratio = 1.0
-
-            if ratio > 0.25:
-                matches["clinician"].append(f"PMID:{pmid or 'unknown'}")
-
-    # Regulatory evidence
     if regulatory and isinstance(regulatory, dict):
         lps = regulatory.get("legal_points", [])
         if isinstance(lps, list):
             for lp in lps:
                 statute = (lp.get("statute") or lp.get("reference") or "").lower()
                 summary = (lp.get("summary") or lp.get("argument") or "").lower()
+                index["regulatory"].append((statute, _evidence_repr(summary)))
+
+    return index
+
+
+def link_evidence(sentence, auditor, clinician, regulatory, index=None, sentence_lc=None):
+    if index is None:
+        index = build_evidence_index(auditor, clinician, regulatory)
+
+    s = sentence_lc if sentence_lc is not None else sentence.lower()
+    matches = {"auditor": [], "clinician": [], "regulatory": []}
 
-                if statute in s:
-                    matches["regulatory"].append(statute)
-                else:
-                    ratio = difflib.SequenceMatcher(None, s, summary).ratio()
-                    if ratio > 0.22:
-                        matches["regulatory"].append(statute or "reg_point")
+    if _USE_SHINGLES:
+        s_sh = shingles(s)
+        similar = lambda ev, source: _containment(s_sh, ev) > _SHINGLE_THRESHOLDS[source]
+    else:
+        similar = lambda m, source: _ratio_above(m, s, _RATIO_THRESHOLDS[source])
+
+    # Auditor evidence
+    for label, m in index["auditor_chunks"]:
+        if similar(m, "auditor"):
+            matches["auditor"].append(label)
+
+    dc = index["denial_code"]
+    if dc and dc in s:
+        matches["auditor"].append(f"DenialCode:{dc}")
+
+    core = index["snippet_core"]
+    if core and any(w in s for w in core):
+        matches["auditor"].append("InsurerReasonSnippet")
+
+    # Clinician evidence
+    for pmid, m in index["clinician"]:
+        if (pmid and pmid in s) or similar(m, "clinician"):
+            matches["clinician"].append(f"PMID:{pmid or 'unknown'}")
+
+    # Regulatory evidence
+    for statute, m in index["regulatory"]:
+        if statute in s:
+            matches["regulatory"].append(statute)
+        elif similar(m, "regulatory"):
+            matches["regulatory"].append(statute or "reg_point")
 
     return matches
 
@@ -216,10 +306,13 @@ def score_claim(matches):
     return score
 
 
+# SubScores / Issue / JudgeScorecard are built below from values this module
+# computed itself (bounded ints, literal severities) → model_construct, no
+# re-validation.
 def compute_subscores(claim_results):
     claims = [c for c in claim_results if c["label"] == "CLAIM"]
     if not claims:
-        return SubScores(
+        return SubScores.model_construct(
             factual_accuracy=95,
             citation_consistency=95,
             logical_adequacy=95,
@@ -233,7 +326,7 @@ def compute_subscores(claim_results):
     factual = int((supported / len(claims)) * 100)
     halluc_risk = int((halluc / len(claims)) * 100)
 
-    return SubScores(
+    return SubScores.model_construct(
         factual_accuracy=factual,
         citation_consistency=factual,
         logical_adequacy=factual,
@@ -257,7 +350,7 @@ def detect_issues(claim_results):
         idx = c["sentence_index"]
 
         if score == 0:
-            issues.append(Issue(
+            issues.append(Issue.model_construct(
                 id=f"ISSUE-{counter}",
                 severity="high",
                 location_in_letter={"sentence_index": idx},
@@ -275,13 +368,13 @@ def detect_issues(claim_results):
             missing.append("regulatory evidence")
 
         if missing:
-            refs = [x for src in c["matches"].values() for x in src]
-            issues.append(Issue(
+            refs = list(dict.fromkeys(x for src in c["matches"].values() for x in src))
+            issues.append(Issue.model_construct(
                 id=f"ISSUE-{counter}",
                 severity="medium",
                 location_in_letter={"sentence_index": idx},
                 description=f"Partially supported claim. Missing: {', '.join(missing)}",
-                evidence_refs=list(set(refs)),
+                evidence_refs=refs,
                 suggested_fix="Strengthen argument by adding missing evidence."
             ))
             counter += 1
@@ -306,14 +399,23 @@ def run_judge_agent(session_dir="data/output/"):
         return None
 
     sentences = split_sentences(letter)
-    labels = classify_sentences(sentences)
+    sentences_lc = [s.lower() for s in sentences]
+    labels = classify_sentences(sentences, sentences_lc)
+
+    evidence_index = build_evidence_index(auditor, clinician, regulatory)
+
+    # Repeated sentences (boilerplate, sign-offs) are linked + scored once per run
+    linked: Dict[str, tuple] = {}
 
     claim_results = []
     for item in labels:
         s = item["sentence"]
         if item["label"] == "CLAIM":
-            matches = link_evidence(s, auditor, clinician, regulatory)
-            score = score_claim(matches)
+            lc = sentences_lc[item["sentence_index"]]
+            if lc not in linked:
+                m = link_evidence(s, auditor, clinician, regulatory, evidence_index, lc)
+                linked[lc] = (m, score_claim(m))
+            matches, score = linked[lc]
         else:
             matches = {"auditor": [], "clinician": [], "regulatory": []}
             score = 0
@@ -327,7 +429,10 @@ def run_judge_agent(session_dir="data/output/"):
     subs = compute_subscores(claim_results)
     issues = detect_issues(claim_results)
 
-    scorecard = JudgeScorecard(
+    overall, status = _overall(subs.model_dump())
+    scorecard = JudgeScorecard.model_construct(
+        overall_score=overall,
+        status=status,
         sub_scores=subs,
         issues=issues,
         confidence_estimate=0.85,
@@ -339,28 +444,32 @@ def run_judge_agent(session_dir="data/output/"):
 
     json_path = os.path.join(session_dir, "judge_scorecard.json")
     with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(scorecard.model_dump(), f, indent=4)
+        f.write(scorecard.model_dump_json(indent=2))
 
     md_path = os.path.join(session_dir, "judge_report.md")
-    with open(md_path, "w", encoding="utf-8") as f:
-        f.write(f"# Judge Agent Report\n\n")
-        f.write(f"**Status:** {scorecard.status}\n")
-        f.write(f"**Overall Score:** {scorecard.overall_score}\n\n")
-
-        f.write("## Sub Scores\n")
-        for k, v in subs.model_dump().items():
-            f.write(f"- **{k.replace('_',' ').title()}:** {v}\n")
+    parts = [
+        "# Judge Agent Report\n\n",
+        f"**Status:** {scorecard.status}\n",
+        f"**Overall Score:** {scorecard.overall_score}\n\n",
+        "## Sub Scores\n",
+    ]
+    parts.extend(f"- **{k.replace('_',' ').title()}:** {v}\n" for k, v in subs.model_dump().items())
+
+    parts.append("\n## Issues\n")
+    if not issues:
+        parts.append("No issues found.\n")
+    else:
+        for issue in issues:
+            parts.append(
+                f"\n### {issue.id} — {issue.severity.upper()}\n"
+                f"**Sentence Index:** {issue.location_in_letter.get('sentence_index')}\n"
+                f"**Description:** {issue.description}\n"
+            )
+            if issue.evidence_refs:
+                parts.append(f"**Evidence Refs:** {', '.join(issue.evidence_refs)}\n")
 
-        f.write("\n## Issues\n")
-        if not issues:
-            f.write("No issues found.\n")
-        else:
-            for issue in issues:
-                f.write(f"\n### {issue.id} — {issue.severity.upper()}\n")
-                f.write(f"**Sentence Index:** {issue.location_in_letter.get('sentence_index')}\n")
-                f.write(f"**Description:** {issue.description}\n")
-                if issue.evidence_refs:
-                    f.write(f"**Evidence Refs:** {', '.join(issue.evidence_refs)}\n")
+    with open(md_path, "w", encoding="utf-8") as f:
+        f.write("".join(parts))
 
     logger.info("[Judge] Completed successfully.")
     return scorecard
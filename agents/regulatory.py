@@ -1,90 +1,155 @@
 # agents/regulatory.py — FINAL PATCHED VERSION FOR WINDOWS + HYBRID FALLBACK
 
+import copy
 import os
-import json
 import logging
 import re
-import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Any, Dict, Optional, List
 
+import requests
 from google import genai
 from google.genai import types
 
-logger = logging.getLogger("RegulatoryAgent")
-logger.setLevel(logging.INFO)
+from ._gemini import get_cached_content
+from . import _llm_cache
+from config.settings import CACHE_DIR, NEAR_DUP_CACHE_THRESHOLD, REGULATORY_NEAR_DUP_CACHE
+from tools.io_utils import json_dumps, json_loads
+from tools.relevance import bm25_top_k
+
+logger = logging.getLogger(__name__)
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 STATUTES_PATH = os.path.join(PROJECT_ROOT, "data", "knowledge", "statutes.md")
 
 MODEL_NAME = "gemini-2.5-flash"
 
-# ---- FULL WINDOWS PATH TO OLLAMA ----
-OLLAMA_EXE = r"C:\Users\VIRAJ\AppData\Local\Programs\Ollama\ollama.exe"
+# Statutes change rarely, but not never → cached analyses expire after a day
+_CACHE_TTL_SECONDS = 24 * 3600
+
+# ---- LOCAL OLLAMA FALLBACK (HTTP API) ----
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434").rstrip("/")
+OLLAMA_MODEL = "llama3.1"
 
 # ============================================================
 # Helpers
 # ============================================================
+# (mtime, text) of the last successful read — one stat per call instead of a
+# full read, and an edited statutes.md is still picked up.
+_statutes_cache: Optional[tuple] = None
+
+
 def load_statutes() -> str:
+    global _statutes_cache
+    try:
+        mtime = os.stat(STATUTES_PATH).st_mtime
+    except FileNotFoundError:
+        logger.warning(f"Statutes file missing: {STATUTES_PATH}")
+        return ""
+    except Exception as e:
+        logger.error(f"Failed to read statutes: {e}")
+        return ""
+
+    cached = _statutes_cache
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
     try:
-        if not os.path.exists(STATUTES_PATH):
-            logger.warning(f"Statutes file missing: {STATUTES_PATH}")
-            return ""
         with open(STATUTES_PATH, "r", encoding="utf-8") as f:
-            return f.read()
+            text = f.read()
     except Exception as e:
         logger.error(f"Failed to read statutes: {e}")
         return ""
+    _statutes_cache = (mtime, text)
+    return text
+
+
+_FENCE_RE = re.compile(r"```json|```")
 
 
 def _clean_json_payload(s: str) -> str:
     if not s:
         return ""
     s = s.strip()
-    s = re.sub(r"```json|```", "", s)
+    s = _FENCE_RE.sub("", s)
 
     start = s.find("{")
     end = s.rfind("}")
     return s[start:end + 1] if start != -1 and end != -1 else s
 
 
-def _extract_gemini_text(resp) -> Optional[str]:
-    if hasattr(resp, "text") and resp.text:
-        return resp.text.strip()
-
+def _extract_first_json_object(s: str) -> Optional[str]:
+    """First balanced {...} in `s` (braces inside JSON strings ignored), or None."""
+    start = s.find("{")
+    if start == -1:
+        return None
+    depth = 0
+    in_str = escaped = False
+    for i in range(start, len(s)):
+        ch = s[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return s[start:i + 1]
+    return None
+
+
+def _loads_object(s: str) -> Optional[Dict[str, Any]]:
+    """Parse `s` as a JSON object; None for invalid JSON or any other JSON type."""
     try:
-        parts = resp.candidates[0].content.parts
-        texts = []
-        for p in parts:
-            if hasattr(p, "text") and p.text:
-                texts.append(p.text)
-        return "\n".join(texts).strip() if texts else None
+        value = json_loads(s)
     except Exception:
         return None
+    return value if isinstance(value, dict) else None
 
 
-def _run_ollama(prompt: str) -> Optional[str]:
-    """Windows-safe Ollama execution with timeout."""
-    env = os.environ.copy()
-    env["LANG"] = "C.UTF-8"
-    env["LC_ALL"] = "C.UTF-8"
+@lru_cache(maxsize=1)
+def _get_client() -> genai.Client:
+    """Process-wide Gemini client for callers that don't pass one (auth + HTTP pool set up once)."""
+    return genai.Client()
+
+
+@lru_cache(maxsize=1)
+def _ollama_session() -> requests.Session:
+    """One keep-alive HTTP session to the local Ollama server for the process."""
+    return requests.Session()
+
 
+def _run_ollama(prompt: str) -> Optional[str]:
+    """Local Ollama fallback over its HTTP API, with timeout."""
     try:
-        result = subprocess.run(
-            [OLLAMA_EXE, "run", "llama3.1"],
-            input=prompt,
-            text=True,
-            encoding="utf-8",
-            errors="ignore",
-            capture_output=True,
-            env=env,
+        resp = _ollama_session().post(
+            f"{OLLAMA_URL}/api/generate",
+            json={
+                "model": OLLAMA_MODEL,
+                "prompt": prompt,
+                "stream": False,
+                "options": {"temperature": 0},
+            },
             timeout=8  # <-- IMPORTANT: prevents workflow hang
         )
-        return result.stdout.strip()
-    except subprocess.TimeoutExpired:
+        resp.raise_for_status()
+        return (resp.json().get("response") or "").strip()
+    except requests.Timeout:
         logger.error("Ollama timed out after 8 seconds.")
         return None
-    except FileNotFoundError:
-        logger.error("Ollama binary not found at specified path.")
+    except requests.ConnectionError:
+        logger.error(f"Ollama server not reachable at {OLLAMA_URL}.")
         return None
     except Exception as e:
         logger.error(f"Ollama failure: {e}")
@@ -96,21 +161,47 @@ def _save_json(folder: str, filename: str, obj: dict):
         os.makedirs(folder, exist_ok=True)
         path = os.path.join(folder, filename)
         with open(path, "w", encoding="utf-8") as f:
-            json.dump(obj, f, indent=2)
+            f.write(json_dumps(obj, indent=True))
         logger.info(f"Regulatory output saved → {path}")
     except Exception as e:
         logger.error(f"Failed to save regulatory output: {e}")
 
 
+# Statutes files up to this size go into the prompt whole (and stay one
+# cacheable prefix); larger ones are trimmed to the sections most relevant
+# to the denial.
+STATUTES_BUDGET_CHARS = 8000
+STATUTES_TOP_SECTIONS = 5
+_SECTION_SPLIT_RE = re.compile(r"(?m)^(?=## )")
+
+
+def select_statutes(statutes: str, ctx: Dict[str, Any]) -> str:
+    """
+    Keep the title plus the `##` sections that share the most vocabulary with
+    the denial (BM25) once the file exceeds the budget; the whole file when it
+    fits or nothing overlaps.
+    """
+    if len(statutes) <= STATUTES_BUDGET_CHARS:
+        return statutes
+
+    head, *sections = _SECTION_SPLIT_RE.split(statutes)
+    query = " ".join(str(v) for v in ctx.values() if isinstance(v, str))
+    top = bm25_top_k(query, sections, k=STATUTES_TOP_SECTIONS)
+    if not top:
+        return statutes
+    # document order reads more naturally than score order
+    return head + "".join(sections[i] for i in sorted(top))
+
+
 # ============================================================
 # Prompt Builder
 # ============================================================
-def _make_prompt(statutes: str, denial: Any) -> str:
-
+def _denial_context(denial: Any) -> Dict[str, Any]:
+    """Prompt-facing fields of the structured denial (a copy; evidence chunks dropped)."""
     if hasattr(denial, "model_dump"):
         ctx = denial.model_dump()
     elif isinstance(denial, dict):
-        ctx = denial
+        ctx = dict(denial)
     else:
         ctx = {
             "denial_code": getattr(denial, "denial_code", ""),
@@ -120,8 +211,10 @@ def _make_prompt(statutes: str, denial: Any) -> str:
         }
 
     ctx.pop("raw_evidence_chunks", None)
+    return ctx
 
-    return f"""
+
+_INSTRUCTION_HEAD = """
 You are a senior Indian Health Insurance Legal Expert (IRDAI, CPA, Ombudsman Rules).
 
 Task:
@@ -129,29 +222,184 @@ Analyze whether the insurer’s denial is compliant.
 
 Return ONLY JSON. No markdown. No prose.
 
-Statutes:
-{statutes}
-
-Structured Context:
-{json.dumps(ctx, indent=2)}
-
 Required JSON:
-{{
+{
   "compliant": true/false,
   "violation": "<short code>",
   "argument": "<short legal reasoning>",
   "action": "<reverse denial | manual review | request info>",
   "legal_points": [
-    {{
+    {
       "statute": "<name>",
       "summary": "<short explanation>",
       "relevance_score": <0.0-1.0>
-    }}
+    }
   ]
-}}
+}
 """
 
 
+def _statutes_block(statutes: str) -> str:
+    """Statutes section of the prompt."""
+    return f"\nStatutes:\n{statutes}\n"
+
+
+def _system_instruction(statutes: str) -> str:
+    """Static part of the prompt (identical across denials) → Gemini context cache."""
+    return _INSTRUCTION_HEAD + _statutes_block(statutes)
+
+
+def _context_prompt(ctx: Dict[str, Any]) -> str:
+    """Per-denial part of the prompt."""
+    return f"\nStructured Context:\n{json_dumps(ctx)}\n"
+
+
+# Fields that vary between extractions of the same denial without changing
+# the legal question (the Auditor's self-reported confidence, bookkeeping)
+_VOLATILE_CTX_KEYS = ("confidence_score", "timestamp", "generated_at", "session_id")
+
+
+def _normalize_ctx(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Cache-key view of the denial context: volatile keys dropped, code casefolded, whitespace collapsed."""
+    norm = {k: v for k, v in ctx.items() if k not in _VOLATILE_CTX_KEYS and k != "raw_evidence_chunks"}
+    for k, v in norm.items():
+        if isinstance(v, str):
+            norm[k] = " ".join(v.split())
+    if isinstance(norm.get("denial_code"), str):
+        norm["denial_code"] = norm["denial_code"].casefold()
+    return norm
+
+
+def _make_prompt(statutes: str, denial: Any) -> str:
+    """Full single-string prompt (Ollama, cache keys): static prefix + denial context."""
+    return _system_instruction(statutes) + _context_prompt(_denial_context(denial))
+
+
+# ============================================================
+# Gemini call
+# ============================================================
+GEMINI_DEADLINE_SECONDS = 30
+
+
+def _stream_gemini_json(client: genai.Client, user_prompt: str,
+                        config: types.GenerateContentConfig) -> Optional[str]:
+    """
+    Stream the analysis and return as soon as a complete JSON object has
+    arrived. None when the wall-clock deadline passes first (a looping or
+    stalled generation) → the caller falls back to Ollama.
+    """
+    deadline = time.monotonic() + GEMINI_DEADLINE_SECONDS
+    parts: List[str] = []
+    for chunk in client.models.generate_content_stream(
+        model=MODEL_NAME,
+        contents=[user_prompt],
+        config=config,
+    ):
+        text = getattr(chunk, "text", None)
+        if text:
+            parts.append(text)
+            if "}" in text:
+                obj = _extract_first_json_object("".join(parts))
+                if obj is not None:
+                    try:
+                        json_loads(obj)
+                        return obj
+                    except Exception:
+                        pass
+        if time.monotonic() > deadline:
+            logger.error(f"[Regulatory] Gemini exceeded {GEMINI_DEADLINE_SECONDS}s — abandoning stream.")
+            return None
+    return "".join(parts)
+
+
+# ============================================================
+# Near-duplicate cache (opt-in)
+# ============================================================
+# Paraphrased denials (same code, reworded reason/clause) produce different
+# prompts, so the exact cache misses them. With REGULATORY_NEAR_DUP_CACHE on,
+# a stored verdict is reused when the denial code and statutes match and the
+# word sets of the free-text fields overlap by ≥ NEAR_DUP_CACHE_THRESHOLD
+# (Jaccard). Off by default: near-identical wording can still change a verdict.
+_NEAR_DUP_PATH = os.path.join(CACHE_DIR, "regulatory_near_dup.json")
+_NEAR_DUP_MAX_ENTRIES = 1000
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+_near_dup: Optional[List[Dict[str, Any]]] = None
+_near_dup_lock = threading.Lock()
+
+
+def _ctx_words(ctx: Dict[str, Any]) -> set:
+    text = " ".join(str(ctx.get(k) or "") for k in
+                    ("procedure_denied", "insurer_reason_snippet", "policy_clause_text"))
+    return set(_WORD_RE.findall(text.lower()))
+
+
+def _load_near_dup() -> List[Dict[str, Any]]:
+    global _near_dup
+    if _near_dup is None:
+        try:
+            with open(_NEAR_DUP_PATH, "rb") as f:
+                _near_dup = json_loads(f.read())
+        except FileNotFoundError:
+            _near_dup = []
+        except Exception as e:
+            logger.warning(f"[Regulatory] Ignoring unreadable near-dup cache: {e}")
+            _near_dup = []
+    return _near_dup
+
+
+def _near_dup_lookup(statutes_key: str, ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    code = str(ctx.get("denial_code") or "").strip().lower()
+    words = _ctx_words(ctx)
+    if not words:
+        return None
+
+    # batch workers append/trim the list concurrently → scan under the lock,
+    # and hand out a copy so callers can't mutate the cached verdict
+    with _near_dup_lock:
+        for entry in _load_near_dup():
+            if entry["statutes"] != statutes_key or entry["code"] != code:
+                continue
+            stored = set(entry["words"])
+            if len(words & stored) / len(words | stored) >= NEAR_DUP_CACHE_THRESHOLD:
+                return copy.deepcopy(entry["result"])
+    return None
+
+
+def _near_dup_store(statutes_key: str, ctx: Dict[str, Any], result: Dict[str, Any]) -> None:
+    with _near_dup_lock:
+        entries = _load_near_dup()
+        entries.append({
+            "statutes": statutes_key,
+            "code": str(ctx.get("denial_code") or "").strip().lower(),
+            "words": sorted(_ctx_words(ctx)),
+            "result": copy.deepcopy(result),
+        })
+        del entries[:-_NEAR_DUP_MAX_ENTRIES]
+
+        tmp = None
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            # unique temp name → concurrent processes don't clobber each other's write
+            fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(json_dumps(entries))
+            os.replace(tmp, _NEAR_DUP_PATH)
+        except Exception as e:
+            if tmp and os.path.exists(tmp):
+                os.remove(tmp)
+            logger.warning(f"[Regulatory] Could not save near-dup cache: {e}")
+
+
+def _relevance(value: Any) -> float:
+    """LLM relevance score → float in [0, 1]; junk ("high", None) → 0.0."""
+    try:
+        score = float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if not score > 0.0 else min(score, 1.0)
+
+
 # ============================================================
 # MAIN REGULATORY AGENT
 # ============================================================
@@ -161,30 +409,66 @@ def run_regulatory_agent(
     session_dir: str = "data/output/",
     save_filename: str = "regulatory_output.json",
     use_gemini: bool = True,
+    client: Optional[genai.Client] = None,
 ) -> Dict[str, Any]:
 
-    statutes = load_statutes()
-    prompt = _make_prompt(statutes, structured_denial_output)
+    all_statutes = load_statutes()
+    ctx = _denial_context(structured_denial_output)
+    statutes = select_statutes(all_statutes, ctx)
+    trimmed = statutes != all_statutes
+    if trimmed:
+        # the selection differs per denial → send it with the denial, keep
+        # only the fixed instructions in the system prompt
+        system_instruction = _INSTRUCTION_HEAD
+        user_prompt = _statutes_block(statutes) + _context_prompt(ctx)
+    else:
+        system_instruction = _system_instruction(statutes)
+        user_prompt = _context_prompt(ctx)
+    prompt = system_instruction + user_prompt
 
     logger.info("[Regulatory] Starting legal compliance analysis...")
 
+    # keyed on the normalized context, not the prompt string, so reruns that
+    # differ only in whitespace/case/confidence still hit
+    cache_key = _llm_cache.make_key(MODEL_NAME, _system_instruction(statutes), _normalize_ctx(ctx))
+    cached = _llm_cache.get("regulatory", cache_key, ttl_seconds=_CACHE_TTL_SECONDS)
+    if cached is not None:
+        try:
+            result = json_loads(cached)
+        except ValueError as e:
+            logger.debug("[Regulatory] Ignoring unreadable cache entry %s: %s", cache_key[:12], e)
+            result = None
+        if isinstance(result, dict):
+            logger.info("[Regulatory] Reusing cached analysis for identical context.")
+            _save_json(session_dir, save_filename, result)
+            return result
+
+    if REGULATORY_NEAR_DUP_CACHE:
+        statutes_key = _llm_cache.make_key(MODEL_NAME, statutes)
+        result = _near_dup_lookup(statutes_key, ctx)
+        if result is not None:
+            logger.info("[Regulatory] Reusing analysis of a near-duplicate denial.")
+            _save_json(session_dir, save_filename, result)
+            return result
+
     # -----------------------------------------------------
     # 1. Gemini primary
     # -----------------------------------------------------
     raw = None
     if use_gemini:
         try:
-            client = genai.Client()
-            resp = client.models.generate_content(
-                model=MODEL_NAME,
-                contents=[prompt],
-                config=types.GenerateContentConfig(
-                    temperature=0.0,
-                    max_output_tokens=2048,
-                    response_mime_type="application/json",
-                )
-            )
-            raw = _extract_gemini_text(resp)
+            client = client or _get_client()
+            # Only the untrimmed statutes file is a static prefix worth a context cache
+            cache_name = None if trimmed else get_cached_content(client, MODEL_NAME, system_instruction)
+            raw = _stream_gemini_json(client, user_prompt, types.GenerateContentConfig(
+                cached_content=cache_name,
+                system_instruction=None if cache_name else system_instruction,
+                temperature=0.0,
+                max_output_tokens=2048,
+                response_mime_type="application/json",
+                # bounds each blocking read; _stream_gemini_json bounds the total
+                http_options=types.HttpOptions(timeout=GEMINI_DEADLINE_SECONDS * 1000),
+            ))
         except Exception as e:
             logger.error(f"[Regulatory] Gemini ERROR: {e}")
             raw = None
@@ -215,10 +499,20 @@ def run_regulatory_agent(
     # -----------------------------------------------------
     # 4. Parse JSON
     # -----------------------------------------------------
-    cleaned = _clean_json_payload(raw)
-    try:
-        parsed = json.loads(cleaned)
-    except Exception:
+    # Gemini's JSON mode normally returns bare JSON → parse as-is first and only
+    # clean (fences, surrounding prose) when that fails, e.g. Ollama output
+    parsed = _loads_object(raw)
+    if parsed is None:
+        cleaned = _clean_json_payload(raw)
+        parsed = _loads_object(cleaned)
+        if parsed is None:
+            # first/last brace can span prose with braces of its own → retry on
+            # just the first balanced object
+            obj = _extract_first_json_object(cleaned)
+            if obj is not None and obj != cleaned:
+                parsed = _loads_object(obj)
+
+    if parsed is None:
         logger.error("[Regulatory] JSON parsing failed.")
         parsed = {
             "compliant": False,
@@ -241,13 +535,50 @@ def run_regulatory_agent(
 
     lp = parsed.get("legal_points", [])
     if isinstance(lp, list):
-        for item in lp:
-            if isinstance(item, dict):
-                result["legal_points"].append({
-                    "statute": str(item.get("statute", "unknown")),
-                    "summary": str(item.get("summary", "")),
-                    "relevance_score": float(item.get("relevance_score", 0) or 0),
-                })
+        result["legal_points"] = [
+            {
+                "statute": str(item.get("statute") or item.get("reference") or "unknown"),
+                "summary": str(item.get("summary") or item.get("argument") or ""),
+                "relevance_score": _relevance(item.get("relevance_score")),
+            }
+            for item in lp if isinstance(item, dict)
+        ]
+
+    if result["violation"] != "UNPARSABLE_JSON":
+        _llm_cache.put("regulatory", cache_key, json_dumps(result))
+        if REGULATORY_NEAR_DUP_CACHE:
+            _near_dup_store(statutes_key, ctx, result)
 
     _save_json(session_dir, save_filename, result)
     return result
+
+
+# ============================================================
+# BATCH ENTRY POINT
+# ============================================================
+REGULATORY_BATCH_WORKERS = 8
+
+
+def run_regulatory_batch(
+    cases: List[Dict[str, Any]],
+    max_workers: int = REGULATORY_BATCH_WORKERS,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Run the Regulatory agent for many denials concurrently. Each case is a dict
+    of run_regulatory_agent keyword arguments — give each its own session_dir
+    (or save_filename) so outputs don't overwrite each other. Results come back
+    in input order; a case that raised is None.
+    """
+    if not cases:
+        return []
+
+    def _one(case: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        try:
+            return run_regulatory_agent(**case)
+        except Exception as e:
+            logger.error(f"[Regulatory] Batch case failed: {e}")
+            return None
+
+    logger.info(f"[Regulatory] Batch of {len(cases)} cases ({max_workers} workers)...")
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(cases))) as pool:
+        return list(pool.map(_one, cases))
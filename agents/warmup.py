@@ -0,0 +1,56 @@
+# agents/warmup.py — Pay the agents' one-time setup cost before the first request
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_WARMUP_LETTER = (
+    "The requested procedure is medically necessary. "
+    "Clinical evidence supports coverage under IRDAI regulations."
+)
+
+
+def warmup_judge() -> None:
+    """Run the Judge's text pipeline once on a dummy letter (difflib, regex, pydantic paths)."""
+    from .judge import build_evidence_index, classify_sentences, link_evidence, split_sentences
+
+    auditor = {"raw_evidence_chunks": ["procedure denied as not medically necessary"],
+               "denial_code": "N/A", "insurer_reason_snippet": "not medically necessary"}
+    clinician = {"root": [{"article_title": "Clinical efficacy", "summary_of_finding": "effective",
+                           "pubmed_id": "0"}]}
+    regulatory = {"legal_points": [{"statute": "irdai", "summary": "coverage regulations"}]}
+
+    index = build_evidence_index(auditor, clinician, regulatory)
+    sentences = split_sentences(_WARMUP_LETTER)
+    for item in classify_sentences(sentences):
+        link_evidence(item["sentence"], auditor, clinician, regulatory, index)
+
+
+def warmup_configs() -> None:
+    """Import google.genai and build the request-invariant GenerateContentConfigs."""
+    from . import auditor, barrister, clinician
+
+    auditor._generate_config(None)
+    barrister._generate_config(None)
+    clinician._tool_config()
+    clinician._synthesis_config()
+
+
+def warmup() -> None:
+    """
+    Call once at server startup so the first request doesn't pay for lazy
+    imports and config construction. Failures are logged, never raised.
+    """
+    start = time.perf_counter()
+    for step in (warmup_configs, warmup_judge):
+        try:
+            step()
+        except Exception as e:
+            logger.warning("[Warmup] %s failed: %s", step.__name__, e)
+    logger.info("[Warmup] Done in %.2fs", time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    warmup()
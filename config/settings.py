@@ -36,6 +36,29 @@ GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-pro")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 
+# Explicit context caching of static system instructions (billed per hour of
+# storage, and Gemini rejects prefixes below its minimum cacheable size —
+# agents silently fall back to sending the instruction inline).
+ENABLE_CONTEXT_CACHE = os.getenv("ADVOCAI_CONTEXT_CACHE", "false").lower() == "true"
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("ADVOCAI_CONTEXT_CACHE_TTL", "3600"))
+
+# Auditor two-tier extraction: gemini-2.5-flash first, gemini-2.5-pro re-check
+# only when flash is unsure (confidence below threshold or key fields empty).
+AUDITOR_VERIFY = os.getenv("AUDITOR_VERIFY", "0").lower() in ("1", "true")
+AUDITOR_VERIFY_THRESHOLD = float(os.getenv("AUDITOR_VERIFY_THRESHOLD", "0.8"))
+
+# Terse Barrister register: compressed prose and a tighter output cap,
+# trading letter length for fewer billed output tokens.
+BARRISTER_TERSE = os.getenv("ADVOCAI_TERSE", "0").lower() in ("1", "true")
+
+# Write raw model output to data/output/*_raw.txt for inspection (off the hot path).
+DEBUG_DUMP = os.getenv("ADVOCAI_DEBUG_DUMP", "0").lower() in ("1", "true")
+
+# Judge evidence matcher: "difflib" (character-level ratio, default) or
+# "shingle" (word 3-shingle containment — faster, stricter). Each matcher has
+# its own per-source cutoffs in agents/judge.py.
+JUDGE_MATCHER = os.getenv("ADVOCAI_JUDGE_MATCHER", "difflib").lower()
+
 
 # ------------------------------------------------------------------------------
 # SESSION & STORAGE PATHS
@@ -49,6 +72,9 @@ OUTPUT_DIR = os.path.join(DATA_DIR, "output")
 SESSIONS_DIR = os.path.join(BASE_DIR, "sessions")        # used by JSON backend
 KNOWLEDGE_DIR = os.path.join(DATA_DIR, "knowledge")
 TOOLS_DIR = os.path.join(BASE_DIR, "tools")
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")                # derived artefacts, safe to delete
+LLM_CACHE_DIR = os.path.join(CACHE_DIR, "llm")
+QUERY_TEMPLATES_PATH = os.path.join(CACHE_DIR, "query_templates.json")
 
 
 # ------------------------------------------------------------------------------
@@ -59,6 +85,19 @@ ENABLE_CHECKPOINTING = True       # Enables saving after each stage
 ENABLE_ERROR_LOGGING = True       # Enables detailed error tracking
 ENABLE_JSON_BACKUP = True         # Always save a local copy of checkpoints
 
+# Content-addressed disk cache of LLM responses (re-runs, prompt tuning).
+# Identical model + instruction + prompt → the stored response, no API call.
+ENABLE_LLM_CACHE = os.getenv("ADVOCAI_CACHE", "0").lower() in ("1", "true")
+
+# Opt-in: Clinician reuses a PubMed query once Gemini has chosen it repeatedly
+# for the same procedure + denial-reason signature, skipping the tool-selection call.
+ENABLE_QUERY_TEMPLATES = os.getenv("ADVOCAI_QUERY_TEMPLATES", "0").lower() in ("1", "true")
+
+# Regulatory reuses a stored verdict for a near-duplicate denial (same code and
+# statutes, reworded reason/clause text). Off by default — wording can matter.
+REGULATORY_NEAR_DUP_CACHE = os.getenv("ADVOCAI_NEAR_DUP_CACHE", "0").lower() in ("1", "true")
+NEAR_DUP_CACHE_THRESHOLD = float(os.getenv("ADVOCAI_NEAR_DUP_THRESHOLD", "0.9"))
+
 
 # ------------------------------------------------------------------------------
 # ORDER OF STAGES (single source of truth)
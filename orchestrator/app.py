@@ -9,6 +9,7 @@ from fastapi.responses import JSONResponse
 
 from storage.session_manager import SessionManager
 from orchestrator.main import orchestrate_advocai_workflow, initialize_gemini_client
+from agents.warmup import warmup
 
 logger = logging.getLogger("AdvocaiAPI")
 app = FastAPI(title="AdvocAI Orchestrator API", version="2.0")
@@ -16,6 +17,9 @@ app = FastAPI(title="AdvocAI Orchestrator API", version="2.0")
 # Initialize Gemini once
 client = initialize_gemini_client()
 
+# Lazy imports / request-invariant configs built now, not on the first request
+warmup()
+
 
 # ================================================================
 # Utility: Run sync orchestrator in thread executor
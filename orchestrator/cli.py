@@ -7,7 +7,7 @@ from rich import print
 from rich.console import Console
 from rich.table import Table
 
-from orchestrator.main import orchestrate_advocai_workflow, initialize_gemini_client
+from orchestrator.main import orchestrate_advocai_workflow, initialize_gemini_client, stream_to_stdout
 from storage.session_manager import SessionManager
 
 console = Console()
@@ -45,7 +45,7 @@ def action_start(case_id: str):
     console.print("Running workflow...")
 
     client = initialize_gemini_client()
-    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id)
+    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id, on_appeal_chunk=stream_to_stdout)
 
     console.print("\n[bold green]Workflow completed successfully![/bold green]")
 
@@ -73,7 +73,7 @@ def action_resume(session_id: str):
         sys.exit(1)
 
     client = initialize_gemini_client()
-    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id)
+    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id, on_appeal_chunk=stream_to_stdout)
 
     console.print("[bold green]Resume complete.[/bold green]")
 
@@ -114,7 +114,7 @@ def action_run_local(case_id: str):
         sys.exit(1)
 
     client = initialize_gemini_client()
-    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id)
+    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id, on_appeal_chunk=stream_to_stdout)
 
     console.print("[bold green]Local run complete.[/bold green]")
 
@@ -4,7 +4,8 @@ import os
 import sys
 import json
 import logging
-from typing import Any, Union
+from typing import Any, Dict, Union
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from google import genai
 from pydantic import BaseModel
@@ -37,6 +38,14 @@ def initialize_gemini_client() -> genai.Client | None:
         return None
 
 
+# -------------------------------------------------------------
+# Streaming sink for the appeal letter (CLI use)
+# -------------------------------------------------------------
+def stream_to_stdout(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
 # -------------------------------------------------------------
 # Robust JSON/text saving utility
 # -------------------------------------------------------------
@@ -80,23 +89,21 @@ def save_json_to_file(obj: Any, path: str) -> bool:
 # -------------------------------------------------------------
 # Safe execution wrapper for checkpointed pipeline
 # -------------------------------------------------------------
-def safe_execute(stage: str, session_id: str, function, *args, **kwargs):
-    """
-    Wrapper that ensures:
-    - checkpoint resume
-    - saving JSON + raw text depending on output type
-    - consistent logging
-    """
-
-    # Already executed? Load checkpoint.
+def _resume_stage(stage: str, session_id: str):
+    """Return (True, checkpoint) if `stage` already ran for this session, else (False, None)."""
     if SessionManager.should_skip_stage(session_id, stage):
         logger.info(f"[{stage.upper()}] Skipped — checkpoint already exists.")
-        return SessionManager.load_checkpoint(session_id, stage)
+        return True, SessionManager.load_checkpoint(session_id, stage)
+    return False, None
 
-    logger.info(f"[{stage.upper()}] Starting...")
 
+def _finish_stage(stage: str, session_id: str, run):
+    """
+    Call `run()` and checkpoint its output. On failure the stage is marked
+    failed and the exception re-raised.
+    """
     try:
-        output = function(*args, **kwargs)
+        output = run()
 
         if output is None or output == "":
             raise RuntimeError(f"{stage} returned no output.")
@@ -132,10 +139,58 @@ def safe_execute(stage: str, session_id: str, function, *args, **kwargs):
         raise e
 
 
+def safe_execute(stage: str, session_id: str, function, *args, **kwargs):
+    """
+    Wrapper that ensures:
+    - checkpoint resume
+    - saving JSON + raw text depending on output type
+    - consistent logging
+    """
+
+    # Already executed? Load checkpoint.
+    done, output = _resume_stage(stage, session_id)
+    if done:
+        return output
+
+    logger.info(f"[{stage.upper()}] Starting...")
+    return _finish_stage(stage, session_id, lambda: function(*args, **kwargs))
+
+
+def _run_stages_concurrently(session_id: str, stages) -> Dict[str, Any]:
+    """
+    Run independent `(stage, function, kwargs)` stages side by side.
+
+    Only the agent functions go to worker threads; every SessionManager
+    call (resume check, checkpoint, failure) stays on the calling thread,
+    in the order the stages are listed, so the session backend is never
+    used concurrently and the last recorded stage is deterministic.
+    """
+    results: Dict[str, Any] = {}
+    jobs = {}
+    with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+        for stage, function, kwargs in stages:
+            done, output = _resume_stage(stage, session_id)
+            if done:
+                results[stage] = output
+            else:
+                logger.info(f"[{stage.upper()}] Starting...")
+                jobs[stage] = pool.submit(function, **kwargs)
+
+        for stage, job in jobs.items():
+            results[stage] = _finish_stage(stage, session_id, job.result)
+    return results
+
+
 # -------------------------------------------------------------
 # MAIN ORCHESTRATOR
 # -------------------------------------------------------------
-def orchestrate_advocai_workflow(client: genai.Client, denial_path: str, policy_path: str, case_id: str):
+def orchestrate_advocai_workflow(
+    client: genai.Client,
+    denial_path: str,
+    policy_path: str,
+    case_id: str,
+    on_appeal_chunk=None,
+):
 
     logger.info("=== AdvocAI Phase II Workflow Initiated ===")
 
@@ -160,27 +215,24 @@ def orchestrate_advocai_workflow(client: genai.Client, denial_path: str, policy_
     save_json_to_file(structured_denial, os.path.join(case_output_dir, "auditor_output.json"))
 
     # ---------------------------------------------------------
-    # STEP 2 — Clinician
+    # STEP 2 + 3 — Clinician and Regulatory
+    # Both depend only on the Auditor → run them side by side
     # ---------------------------------------------------------
-    clinical_evidence: EvidenceList = safe_execute(
-        "clinician",
-        session_id,
-        run_clinician_agent,
-        client=client,
-        denial_details=structured_denial
-    )
-    save_json_to_file(clinical_evidence, os.path.join(case_output_dir, "clinician_output.json"))
+    results = _run_stages_concurrently(session_id, [
+        ("clinician", run_clinician_agent, dict(
+            client=client,
+            denial_details=structured_denial,
+        )),
+        ("regulatory", run_regulatory_agent, dict(
+            structured_denial_output=structured_denial,
+            session_dir=case_output_dir,
+            client=client,
+        )),
+    ])
+    clinical_evidence: EvidenceList = results["clinician"]
+    regulatory_result = results["regulatory"]
 
-    # ---------------------------------------------------------
-    # STEP 3 — Regulatory
-    # ---------------------------------------------------------
-    regulatory_result = safe_execute(
-        "regulatory",
-        session_id,
-        run_regulatory_agent,
-        structured_denial_output=structured_denial,
-        session_dir=case_output_dir
-    )
+    save_json_to_file(clinical_evidence, os.path.join(case_output_dir, "clinician_output.json"))
     save_json_to_file(regulatory_result, os.path.join(case_output_dir, "regulatory_output.json"))
 
     # ---------------------------------------------------------
@@ -193,7 +245,8 @@ def orchestrate_advocai_workflow(client: genai.Client, denial_path: str, policy_
         client=client,
         denial_details=structured_denial,
         clinical_evidence=clinical_evidence,
-        regulatory_evidence=regulatory_result
+        regulatory_evidence=regulatory_result,
+        on_chunk=on_appeal_chunk
     )
     save_json_to_file(final_appeal_text, os.path.join(case_output_dir, "barrister_output.txt"))
 
@@ -231,4 +284,4 @@ if __name__ == "__main__":
         logger.error(f"Missing input files for case_id={case_id}")
         sys.exit(2)
 
-    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id)
+    orchestrate_advocai_workflow(client, denial_path, policy_path, case_id, on_appeal_chunk=stream_to_stdout)
@@ -7,12 +7,22 @@ and produces stable segments for downstream LLM agents.
 
 from pypdf import PdfReader
 from typing import List, Dict, Any
+from functools import lru_cache
+import hashlib
+import json
 import re
 import os
 import logging
 
+from config.settings import CACHE_DIR
+
 logger = logging.getLogger(__name__)
 
+# Extraction results keyed by SHA-256 of the file bytes.
+# Bump the version whenever the extraction output format changes.
+DOCUMENT_CACHE_DIR = os.path.join(CACHE_DIR, "documents")
+DOCUMENT_CACHE_VERSION = 1
+
 
 # ---------------------------------------------------------
 # CLEANUP HELPERS
@@ -147,6 +157,61 @@ def extract_text_from_document(file_path: str) -> Dict[str, Any]:
     }
 
 
+# ---------------------------------------------------------
+# CACHED EXTRACTION (content-hash keyed)
+# ---------------------------------------------------------
+def _sha256_of_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=32)
+def _extract_cached(file_path: str, mtime_ns: int, size: int) -> Dict[str, Any]:
+    """(path, mtime, size) memo in front of a persistent per-digest JSON cache."""
+    digest = _sha256_of_file(file_path)
+    cache_path = os.path.join(
+        DOCUMENT_CACHE_DIR, f"{digest}.v{DOCUMENT_CACHE_VERSION}.json"
+    )
+
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"[PDF Cache] Ignoring unreadable cache entry {cache_path}: {e}")
+
+    result = extract_text_from_document(file_path)
+
+    if result.get("success"):
+        try:
+            os.makedirs(DOCUMENT_CACHE_DIR, exist_ok=True)
+            tmp_path = cache_path + ".part"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, cache_path)
+        except Exception as e:
+            logger.warning(f"[PDF Cache] Failed to persist {cache_path}: {e}")
+
+    return result
+
+
+def extract_text_from_document_cached(file_path: str) -> Dict[str, Any]:
+    """
+    Same contract as extract_text_from_document(), but skips PDF parsing
+    when an identical file (by content hash) was already extracted.
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return extract_text_from_document(file_path)
+
+    # shallow copy so callers cannot mutate the memoized dict
+    return dict(_extract_cached(file_path, st.st_mtime_ns, st.st_size))
+
+
 # ---------------------------------------------------------
 # Standalone test
 # ---------------------------------------------------------
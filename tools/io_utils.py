@@ -9,11 +9,38 @@ import json
 import re
 import logging
 import os
+from pathlib import Path
 from typing import Optional, Dict, Any, Union
 from pydantic import BaseModel
 
 logger = logging.getLogger("io_utils")
 
+# orjson is 2–5× faster than stdlib json; keep stdlib as a drop-in fallback
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+
+# ---------------------------------------------------------
+# FAST JSON (orjson with stdlib fallback)
+# ---------------------------------------------------------
+def json_loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON text/bytes. Raises ValueError (JSONDecodeError) on bad input."""
+    if _HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any, *, indent: bool = False) -> str:
+    """Serialize to a JSON str; `indent=True` gives 2-space pretty output."""
+    if _HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0).decode("utf-8")
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
 
 # ---------------------------------------------------------
 # FILE-SAFE SAVE HELPERS
@@ -71,10 +98,13 @@ def _rotate_backup(path: str):
 # RAW LLM RESPONSE UTILITIES
 # ---------------------------------------------------------
 def save_llm_raw_dump(text: str, path: str):
-    """Write the full raw LLM response for debugging."""
+    """Write the full raw LLM response for debugging (UTF-8, atomic replace)."""
     try:
-        with open(path, "w", encoding="utf-8") as fh:
-            fh.write(text)
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_bytes(text.encode("utf-8"))
+        os.replace(tmp, target)
         logger.debug(f"[IO] Raw LLM dump saved → {path}")
     except Exception as e:
         logger.error(f"[IO] Failed to write LLM dump: {e}")
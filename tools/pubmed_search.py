@@ -6,9 +6,12 @@ Clean, deterministic, LLM-safe, no stdout noise, consistent return type.
 import os
 import re
 import time
+import threading
 import requests
+from collections import OrderedDict
+from concurrent.futures import Future
 import xml.etree.ElementTree as ET
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -90,8 +93,17 @@ def _safe_request(url: str, params: dict, retries: int = 3) -> Optional[requests
 
 
 # ----------------------------------------------------------------------
-# MAIN API WRAPPER
+# IN-PROCESS MEMO
 # ----------------------------------------------------------------------
+# Keyed by (normalized query, max_results). A caller arriving while the same
+# search is still in flight waits on it instead of hitting NCBI twice.
+# Bounded LRU; entries older than _SEARCH_TTL_SECONDS are searched again.
+_SEARCH_MEMO_SIZE = 256
+_SEARCH_TTL_SECONDS = 3600
+_SEARCHES: "OrderedDict[tuple, Tuple[float, Future]]" = OrderedDict()
+_SEARCHES_LOCK = threading.Lock()
+
+
 def pubmed_search(query: str, max_results: int = 3) -> List[Dict[str, str]]:
     """
     Clean, LLM-safe PubMed API wrapper.
@@ -103,6 +115,39 @@ def pubmed_search(query: str, max_results: int = 3) -> List[Dict[str, str]]:
     if not query or len(query.strip()) < 6:
         return []
 
+    key = (" ".join(query.lower().split()), max_results)
+    now = time.monotonic()
+    with _SEARCHES_LOCK:
+        entry = _SEARCHES.get(key)
+        owner = entry is None or now - entry[0] > _SEARCH_TTL_SECONDS
+        if owner:
+            entry = _SEARCHES[key] = (now, Future())
+        _SEARCHES.move_to_end(key)
+        if len(_SEARCHES) > _SEARCH_MEMO_SIZE:
+            _SEARCHES.popitem(last=False)
+        fut = entry[1]
+
+    if owner:
+        try:
+            results = _pubmed_search_uncached(query, max_results)
+        except Exception:
+            results = []
+        fut.set_result(results)
+        if not results:
+            # Empty usually means a transient network failure → don't pin it
+            with _SEARCHES_LOCK:
+                if _SEARCHES.get(key, (None, None))[1] is fut:
+                    _SEARCHES.pop(key)
+
+    return [dict(a) for a in fut.result()]
+
+
+# ----------------------------------------------------------------------
+# MAIN API WRAPPER
+# ----------------------------------------------------------------------
+def _pubmed_search_uncached(query: str, max_results: int) -> List[Dict[str, str]]:
+    """ESEARCH → EFETCH round trip, no memoization."""
+
     # --- STEP 1: ESEARCH ---
     esearch_params = {
         "db": "pubmed",
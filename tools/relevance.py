@@ -0,0 +1,82 @@
+# tools/relevance.py
+"""
+Advocai – Lightweight Lexical Relevance Ranking
+Dependency-free BM25 used to trim long documents down to the passages
+that matter before they are sent to an LLM.
+"""
+
+import math
+import re
+from collections import Counter
+from typing import List, Sequence
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_BLOCK_SPLIT_RE = re.compile(r"\n\s*\n")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase alphanumeric tokens."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def split_passages(text: str, max_chars: int = 1000) -> List[str]:
+    """
+    Split text on blank lines, then cut long blocks into ~max_chars windows
+    at whitespace so every passage is a comparable unit for ranking.
+    """
+    passages: List[str] = []
+    for block in _BLOCK_SPLIT_RE.split(text or ""):
+        block = block.strip()
+        while len(block) > max_chars:
+            cut = block.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            passages.append(block[:cut].strip())
+            block = block[cut:].strip()
+        if block:
+            passages.append(block)
+    return passages
+
+
+def bm25_top_k(
+    query: str,
+    documents: Sequence[str],
+    k: int = 3,
+    k1: float = 1.5,
+    b: float = 0.75,
+) -> List[int]:
+    """
+    Indices of the `k` documents most relevant to `query` (Okapi BM25),
+    best first. Documents with no query-term overlap are never returned.
+    """
+    docs = [tokenize(d) for d in documents]
+    if not docs:
+        return []
+
+    n = len(docs)
+    avgdl = (sum(len(toks) for toks in docs) / n) or 1.0
+
+    df: Counter = Counter()
+    for toks in docs:
+        df.update(set(toks))
+
+    terms = set(tokenize(query)) & df.keys()
+    if not terms:
+        return []
+
+    idf = {t: math.log(1.0 + (n - df[t] + 0.5) / (df[t] + 0.5)) for t in terms}
+
+    scored = []
+    for i, toks in enumerate(docs):
+        tf = Counter(toks)
+        norm = k1 * (1.0 - b + b * len(toks) / avgdl)
+        score = 0.0
+        for t in terms:
+            f = tf.get(t)
+            if f:
+                score += idf[t] * f * (k1 + 1.0) / (f + norm)
+        if score > 0.0:
+            scored.append((score, i))
+
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [i for _, i in scored[:k]]